@@ -0,0 +1,178 @@
+import argparse, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import sim
+from metrics import Metrics
+
+# Offline balance runner: plays whole headless games with a scripted build
+# policy, one game per worker process, and reports how each wave went.
+#
+#   python balance.py --seeds 16 --workers 8
+#   python balance.py --templates templates.json variant.json --out sweep.json
+
+STEP = 1/60
+DECIDE_EVERY = 0.5
+
+POLICIES = {
+    "greedy": ["Scout", "Scout", "Orchard", "Sniper", "Bomber", "Scout", "Orchard", "Turret", "Tesla",
+               "Sniper", "Minigunner", "Bomber", "Mercenary", "Commando", "Flamethrower", "Turret",
+               "Minigunner", "Commando", "Sniper", "Tesla"],
+    "economy": ["Scout", "Orchard", "Orchard", "Sniper", "Orchard", "Bomber", "Turret", "Minigunner",
+                "Commando", "Tesla", "Minigunner", "Commando", "Turret", "Sniper", "Bomber", "Mercenary",
+                "Commando", "Minigunner", "Tesla", "Turret"],
+    "splash": ["Scout", "Bomber", "Orchard", "Bomber", "Tesla", "Flamethrower", "Bomber", "Tesla",
+               "Sniper", "Turret", "Minigunner", "Bomber", "Tesla", "Commando", "Minigunner", "Sniper",
+               "Commando", "Turret", "Bomber", "Tesla"],
+}
+
+def build_spots(game, near=140, clear=60, gap=80, step=40):
+    # Lattice points beside the road, best-covering first: each spot is scored
+    # by how much of the routes lies within 300 px of it.
+    paths = [lane.path for lane in game.lanes]
+    samples = [path.position(d) for path in paths for d in range(0, int(path.total), 20)]
+    spots = []
+    for x in range(step, int(game.W), step):
+        for y in range(step, int(game.H), step):
+            if clear <= min(path.distance(x, y) for path in paths) <= near:
+                cover = sum(1 for sx, sy in samples if (sx - x)**2 + (sy - y)**2 <= 300**2)
+                spots.append((-cover, x, y))
+    spots.sort()
+    chosen = []
+    for _, x, y in spots:
+        if all((x - cx)**2 + (y - cy)**2 >= gap**2 for cx, cy in chosen):
+            chosen.append((x, y))
+    return chosen
+
+class ScriptedPolicy:
+    def __init__(self, game, order):
+        self.game = game
+        self.order = list(order)
+        self.spots = build_spots(game)
+
+    def act(self):
+        game = self.game
+        if self.order and len(game.towers) < game.tower_limit and self.spots:
+            name = self.order[0]
+            if game.money >= sim.towerTemp[name]["cost"]:
+                x, y = self.spots.pop(0)
+                game.place_tower(x, y, name)
+                self.order.pop(0)
+                return
+            # Save up for the next build instead of spending it on upgrades.
+            return
+        upgradable = [t for t in game.towers if t.lvl != t.maxlvl]
+        if upgradable:
+            t = min(upgradable, key=lambda t: t.nextupgradeprice)
+            if game.money >= t.nextupgradeprice:
+                t.upgrade()
+
+def run_game(job):
+    # A game that raises (say a wave naming an enemy with no template) comes
+    # back as an error record instead of taking the whole sweep down with it.
+    try:
+        return play_game(job)
+    except Exception as e:
+        return {"templates": job.get("templates") or "templates.json", "map": job.get("map"),
+                "policy": job["policy"], "seed": job["seed"], "error": f"{type(e).__name__}: {e}"}
+
+def play_game(job):
+    if job.get("templates"):
+        sim.use_templates(job["templates"])
+    game = sim.Simulation(seed=job["seed"], map_name=job.get("map"))
+    if job.get("metrics"):
+        game.metrics = Metrics()
+    policy = ScriptedPolicy(game, POLICIES[job["policy"]])
+    waves = []
+    wave, hp_at_start, since = 0, game.base.hp, 0.0
+
+    def finish_wave():
+        waves.append({"wave": wave, "survived": not game.over, "leak": hp_at_start - game.base.hp,
+                      "money": game.money, "time": round(game.time, 2)})
+
+    started = time.perf_counter()
+    while not game.end and not game.over and game.time < job["max_time"]:
+        since += STEP
+        if since >= DECIDE_EVERY:
+            since = 0.0
+            policy.act()
+        game.tick(STEP)
+        if game.wave != wave or game.over:
+            if wave:
+                finish_wave()
+            wave, hp_at_start = game.wave, game.base.hp
+    if wave and not game.over:
+        # The last wave of a win, or the one a max_time cutoff landed in.
+        finish_wave()
+    return {
+        "error": None,
+        "templates": job.get("templates") or "templates.json",
+        "map": game.map_name,
+        "policy": job["policy"],
+        "seed": job["seed"],
+        "won": game.end and not game.over,
+        "last_wave": game.wave,
+        "base_hp": game.base.hp,
+        "ticks": game.ticks,
+        "seconds": round(time.perf_counter() - started, 3),
+        "waves": waves,
+        "towers": [{"name": t.name, "lvl": t.lvl, "x": t.x, "y": t.y, "totaldmg": t.totaldmg} for t in game.towers],
+        "metrics": list(game.metrics.rows()) if game.metrics else None,
+    }
+
+def summarize(results):
+    groups = {}
+    for r in results:
+        if r["error"]:
+            print(f"{r['templates']} / {r['map'] or 'default map'} / {r['policy']} / seed {r['seed']}: {r['error']}")
+            continue
+        groups.setdefault((r["templates"], r["map"], r["policy"]), []).append(r)
+    for (templates, level, policy), runs in sorted(groups.items()):
+        wins = sum(r["won"] for r in runs)
+        print(f"{templates} / {level} / {policy}: {wins}/{len(runs)} won, "
+              f"avg last wave {sum(r['last_wave'] for r in runs) / len(runs):.1f}, "
+              f"avg {sum(r['ticks'] for r in runs) / max(1e-9, sum(r['seconds'] for r in runs)):.0f} ticks/s")
+        leaks = {}
+        for r in runs:
+            for w in r["waves"]:
+                leaks.setdefault(w["wave"], []).append(w)
+        for n in sorted(leaks):
+            ws = leaks[n]
+            survived = sum(w["survived"] for w in ws)
+            leak = sum(w["leak"] for w in ws) / len(ws)
+            money = sum(w["money"] for w in ws) / len(ws)
+            if leak or survived != len(ws):
+                print(f"  wave {n:>2}: survived {survived}/{len(ws)}  avg leak {leak:6.1f}  avg money {money:8.0f}")
+        dmg = {}
+        for r in runs:
+            for t in r["towers"]:
+                dmg.setdefault(t["name"], []).append(t["totaldmg"])
+        for name, values in sorted(dmg.items(), key=lambda kv: -sum(kv[1])):
+            print(f"  {name:<13} x{len(values):<3} avg totaldmg {sum(values) / len(values):10.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run headless td games in parallel for wave balancing.")
+    parser.add_argument("--seeds", type=int, default=8, help="games per templates/policy pair")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--policy", nargs="+", default=["greedy"], choices=sorted(POLICIES))
+    parser.add_argument("--templates", nargs="+", default=[None], help="templates.json variants to sweep")
+    parser.add_argument("--map", nargs="+", default=[None], help="maps to play (default: the templates' default_map)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-time", type=float, default=20000, help="simulated seconds before a game is cut off")
+    parser.add_argument("--out", help="write every result as JSON here")
+    parser.add_argument("--metrics", action="store_true", help="record per-tower, per-wave telemetry into the results")
+    args = parser.parse_args(argv)
+
+    jobs = [{"templates": os.path.abspath(t) if t else None, "map": m, "policy": p, "seed": s,
+             "max_time": args.max_time, "metrics": args.metrics}
+            for t in args.templates for m in args.map for p in args.policy
+            for s in range(args.first_seed, args.first_seed + args.seeds)]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(run_game, jobs))
+    print(f"{len(results)} games in {time.perf_counter() - started:.1f}s on {args.workers} workers")
+    summarize(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import argparse, gc, json, os, platform, sys, time, tracemalloc, random
+from sim import Simulation, towerProto, enemyProto, HAS_NUMPY
+from balance import build_spots
+import snapshot
+
+# Headless micro benchmarks for the td simulation.
+#   python bench.py [enemy counts...]
+#   python bench.py late.tds         (whole ticks from a saved state, see snapshot.py)
+#   python bench.py suite [--ticks N] [--only NAME...] [--out FILE]
+#
+# The suite runs synthetic stress scenarios in object and table mode and
+# prints one JSON line per run: ticks/s from a plain timing pass, then the
+# allocation side from a second, traced pass (gc collections and net live
+# blocks over the run, tracemalloc peak). The render scenarios draw every
+# tick through SDL's dummy video driver, render_half with the world pass at
+# half resolution.
+
+def scatter_enemies(sim, count, rng):
+    # Drop enemies at random points along the road so they cluster like a real wave.
+    names = ["Normal", "Swift", "Heavy", "Shadow", "Goo", "Hyper Swift"]
+    for _ in range(count):
+        e = sim.spawn_enemy(rng.choice(names))
+        e.place(rng.uniform(0, sim.path.total))
+
+def place_towers(sim, count, rng):
+    names = [n for n in towerProto if not towerProto[n].money_tower]
+    sim.tower_limit = count
+    for i in range(count):
+        t = sim.place_tower(rng.uniform(100, sim.W - 100), rng.uniform(100, sim.H - 100), names[i % len(names)])
+        t.hidden = True
+
+def linear_targets(sim):
+    # The pre-grid targeting: every tower measures every enemy.
+    found = 0
+    for t in sim.towers:
+        best = None
+        for i in sim.enemies:
+            dx, dy = t.x - i.x, t.y - i.y
+            if (dx**2 + dy**2)**0.5 <= t.range:
+                if best is None or i.process > best.process:
+                    best = i
+        found += best is not None
+    return found
+
+def grid_targets(sim):
+    sim.grid.rebuild(sim.enemies)
+    found = 0
+    for t in sim.towers:
+        found += sim.grid.best(t.x, t.y, t.range, t.mode, t.hidden) is not None
+    return found
+
+def timeit(fn, sim, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(sim)
+    return (time.perf_counter() - start) / repeat
+
+def bench_targeting(counts, towers=20, repeat=5, seed=1):
+    rows = []
+    for count in counts:
+        rng = random.Random(seed)
+        sim = Simulation()
+        sim.money = 10**9
+        place_towers(sim, towers, rng)
+        scatter_enemies(sim, count, rng)
+        lin = timeit(linear_targets, sim, repeat)
+        grid = timeit(grid_targets, sim, repeat)
+        rows.append((count, lin, grid))
+        print(f"{count:>7} enemies  {towers} towers  linear {lin*1000:8.2f} ms/tick  grid {grid*1000:8.2f} ms/tick  x{lin/grid:5.1f}")
+    return rows
+
+def bench_snapshot(path, ticks=1800, step=1/60):
+    with open(path, "rb") as f:
+        data = f.read()
+    rows = []
+    for use_table in (False, True) if HAS_NUMPY else (False,):
+        sim = snapshot.loads(data, use_table)
+        start = time.perf_counter()
+        n = 0
+        while n < ticks and not sim.over and not sim.end:
+            sim.tick(step)
+            n += 1
+        elapsed = time.perf_counter() - start
+        rows.append((use_table, n, elapsed))
+        print(f"{path}  wave {sim.wave}  {'table ' if use_table else 'object'}  {n} ticks  {n/elapsed:9.0f} ticks/s  "
+              f"{len(sim.enemies)} enemies left")
+    return rows
+
+STEP = 1/60
+
+def freeze(sim):
+    # Synthetic scenarios run without the wave schedule and cannot be lost.
+    sim.end = True
+    sim.base.maxhp = sim.base.hp = 10**12
+    sim.money = 10**9
+    sim.tower_limit = 10**6
+
+def spawnable():
+    # Templates whose death spawns all exist (templates.json names a missing "CEO").
+    return [n for n, p in enemyProto.items() if all(d in enemyProto for d in p.death_spawn)]
+
+def build_towers(sim, names, per_type, maxed=False):
+    spots = build_spots(sim, gap=60)
+    for i in range(per_type):
+        for name in names:
+            x, y = spots[len(sim.towers) % len(spots)]
+            t = sim.place_tower(x, y, name)
+            t.hidden = True
+            while maxed and t.lvl != t.maxlvl:
+                t.level_up()
+
+def keep_enemies(sim, rng, names, target):
+    def hook():
+        for _ in range(target - len(sim.enemies)):
+            sim.spawn_enemy(rng.choice(names)).place(rng.uniform(0, sim.path.total * 0.5))
+    return hook
+
+def scenario_towers(sim, rng):
+    # Two of every tower type against a steady stream of basic enemies.
+    build_towers(sim, list(towerProto), 2)
+    scatter_enemies(sim, 300, rng)
+    return keep_enemies(sim, rng, ["Normal", "Swift", "Heavy", "Shadow", "Goo"], 300)
+
+def scenario_enemies(sim, rng):
+    # Thirty of every enemy template on the road, twenty mixed towers.
+    names = spawnable()
+    for name in names:
+        for _ in range(30):
+            sim.spawn_enemy(name).place(rng.uniform(0, sim.path.total))
+    place_towers(sim, 20, rng)
+    return keep_enemies(sim, rng, names, 30 * len(names))
+
+def scenario_cascade(sim, rng):
+    # Slime/Myth/Mythic storms under maxed towers: every kill spawns more.
+    build_towers(sim, list(towerProto), 2, maxed=True)
+    names = ["Slime"] * 4 + ["Myth"] * 2 + ["Mythic"] * 2
+    for _ in range(400):
+        sim.spawn_enemy(rng.choice(names)).place(rng.uniform(0, sim.path.total * 0.6))
+    return keep_enemies(sim, rng, names, 200)
+
+def scenario_splash(sim, rng):
+    # A hundred blast shells in flight at all times over a slow, tough crowd.
+    build_towers(sim, ["Bomber"], 4)
+    bomber = sim.towers[0]
+    for _ in range(300):
+        sim.spawn_enemy("Heavy").place(rng.uniform(0, sim.path.total))
+    crowd = keep_enemies(sim, rng, ["Heavy", "Tank"], 300)
+    def hook():
+        crowd()
+        for _ in range(100 - len(sim.projectiles)):
+            tx, ty = sim.path.position(rng.uniform(0, sim.path.total))
+            sim.launch(tx, ty, rng.uniform(0, sim.W), rng.uniform(0, sim.H), bomber.radius, bomber.dmg, "#00ffff", 25,
+                       bomber)
+    return hook
+
+SCENARIOS = {
+    "towers": (scenario_towers, False),
+    "enemies": (scenario_enemies, False),
+    "cascade": (scenario_cascade, False),
+    "splash": (scenario_splash, False),
+    "render": (scenario_enemies, 1.0),
+    "render_half": (scenario_enemies, 0.5),
+}
+
+def renderer(sim, scale):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from layers import StaticLayer
+    from render import draw_world
+    from backbuffer import RenderScale
+    pygame.display.init()
+    size = (int(sim.W), int(sim.H))
+    screen = pygame.display.set_mode(size)
+    view = RenderScale(size, scale)
+    background = StaticLayer(view.target(screen).get_size())
+    def draw():
+        world = view.target(screen)
+        background.draw(world, sim)
+        draw_world(world, sim, 0)
+        view.present(screen)
+        pygame.display.flip()
+    return draw
+
+def run_scenario(name, ticks=600, use_table=False, seed=1):
+    build, render = SCENARIOS[name]
+
+    def setup():
+        sim = Simulation(use_table=use_table, seed=seed)
+        freeze(sim)
+        hook = build(sim, random.Random(seed))
+        return sim, hook, renderer(sim, render) if render else None
+
+    def play(sim, hook, draw):
+        for _ in range(ticks):
+            hook()
+            sim.tick(STEP)
+            if draw is not None:
+                draw()
+
+    sim, hook, draw = setup()
+    start = time.perf_counter()
+    play(sim, hook, draw)
+    elapsed = time.perf_counter() - start
+    enemies = len(sim.enemies)
+
+    sim, hook, draw = setup()
+    gc.collect()
+    collections = sum(s["collections"] for s in gc.get_stats())
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    play(sim, hook, draw)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "scenario": name,
+        "mode": "table" if use_table else "object",
+        "ticks": ticks,
+        "seconds": round(elapsed, 4),
+        "ticks_per_s": round(ticks / elapsed, 1),
+        "enemies": enemies,
+        "gc_collections": sum(s["collections"] for s in gc.get_stats()) - collections,
+        "net_blocks": sys.getallocatedblocks() - blocks,
+        "peak_kb": round(peak / 1024, 1),
+        "pools": sim.pool_stats(),
+    }
+
+def suite_main(argv):
+    parser = argparse.ArgumentParser(prog="bench.py suite", description="Synthetic td stress scenarios.")
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--modes", nargs="+", choices=("object", "table"),
+                        default=["object", "table"] if HAS_NUMPY else ["object"])
+    parser.add_argument("--out", help="also write all results as one JSON document")
+    args = parser.parse_args(argv)
+    results = []
+    for name in args.only:
+        for mode in args.modes:
+            result = run_scenario(name, args.ticks, mode == "table", args.seed)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"python": platform.python_version(), "numpy": HAS_NUMPY, "results": results}, f, indent=1)
+    return results
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["suite"]:
+        suite_main(sys.argv[2:])
+        sys.exit()
+    snapshots = [a for a in sys.argv[1:] if a.endswith(".tds")]
+    for path in snapshots:
+        bench_snapshot(path)
+    if not snapshots:
+        counts = [int(a) for a in sys.argv[1:]] or [100, 500, 1000, 5000, 10000]
+        bench_targeting(counts)
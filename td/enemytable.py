@@ -0,0 +1,194 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Struct-of-arrays storage for live enemies. Slots are handed out from a free
+# list, `alive` marks the rows in use and `views` maps a row back to the Enemy
+# object the UI holds. Movement along the map is one vectorized step over every
+# live row and damage is applied through arrays of row indices. The table also
+# answers the same range queries as SpatialHash, so the simulation can use it
+# in place of the grid: Simulation.grid is either one and is asked to
+# rebuild(enemies) after movement, then to query(x, y, r) and
+# best(x, y, r, mode, hidden).
+
+HAS_NUMPY = np is not None
+
+class EnemyTable:
+    def __init__(self, capacity=256):
+        if np is None:
+            raise RuntimeError("EnemyTable needs numpy")
+        self.capacity = 0
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.hp = np.zeros(0, dtype=np.int64)
+        self.maxhp = np.zeros(0, dtype=np.int64)
+        self.speed = np.zeros(0)
+        self.lane = np.zeros(0, dtype=np.int32)
+        self.idx = np.zeros(0, dtype=np.int32)
+        self.process = np.zeros(0)
+        self.hidden = np.zeros(0, dtype=bool)
+        self.alive = np.zeros(0, dtype=bool)
+        self.views = []
+        self.free = []
+        self.released = []
+        self.lanes = None
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        extra = capacity - self.capacity
+        for name in ("x", "y", "hp", "maxhp", "speed", "lane", "idx", "process", "hidden", "alive"):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros(extra, dtype=arr.dtype))))
+        self.views.extend([None] * extra)
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def add(self, view):
+        if not self.free:
+            self.grow(self.capacity * 2)
+        slot = self.free.pop()
+        self.alive[slot] = True
+        self.views[slot] = view
+        return slot
+
+    def release(self, slot):
+        # The row keeps its values until flush() so views still held this tick
+        # (grid buckets, target lists) read a dead enemy instead of a new one.
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.views[slot] = None
+            self.released.append(slot)
+
+    def flush(self):
+        self.free.extend(self.released)
+        self.released.clear()
+
+    def __len__(self):
+        return self.capacity - len(self.free) - len(self.released)
+
+    def compile_lanes(self, lanes):
+        # Every lane's segments end to end in one set of arrays. A row's key
+        # into them is its distance plus the combined length of the lanes
+        # before its own, so one searchsorted finds the segment for all rows
+        # whatever lane they are on.
+        self.lanes = lanes
+        cum, key, px, py, ux, uy = [], [], [], [], [], []
+        self.first, self.last, self.offset, self.total = [], [], [], []
+        offset = 0.0
+        for lane in lanes:
+            path = lane.path
+            self.first.append(len(cum))
+            self.last.append(len(cum) + path.segments - 1)
+            self.offset.append(offset)
+            self.total.append(path.total)
+            cum.extend(path.cum[:-1])
+            key.extend(offset + c for c in path.cum[:-1])
+            px.extend(p[0] for p in path.points[:-1])
+            py.extend(p[1] for p in path.points[:-1])
+            ux.extend(path.ux)
+            uy.extend(path.uy)
+            offset += path.total
+        self.cum, self.key = np.asarray(cum), np.asarray(key)
+        self.px, self.py = np.asarray(px), np.asarray(py)
+        self.ux, self.uy = np.asarray(ux), np.asarray(uy)
+        self.first, self.last = np.asarray(self.first), np.asarray(self.last)
+        self.offset, self.total = np.asarray(self.offset), np.asarray(self.total)
+
+    def step(self, dt, lanes):
+        # Same walk as Enemy.step for every live row at once: advance the
+        # distance, then look positions up in the compiled lanes. Returns the
+        # rows that ran off the end of their lane this step.
+        if self.lanes is not lanes:
+            self.compile_lanes(lanes)
+        live = np.flatnonzero(self.alive)
+        if live.size == 0:
+            return live
+        process = self.process[live] + self.speed[live] * dt
+        self.process[live] = process
+        lane = self.lane[live]
+        done = process >= self.total[lane]
+        finished = live[done]
+        live, process, lane = live[~done], process[~done], lane[~done]
+        seg, self.x[live], self.y[live] = self.locate(process, lane)
+        self.idx[live] = seg - self.first[lane]
+        return finished
+
+    def locate(self, process, lane):
+        seg = np.searchsorted(self.key, self.offset[lane] + process, side="right") - 1
+        # Rounding in the offset can land a row on a neighbouring lane's edge.
+        np.clip(seg, self.first[lane], self.last[lane], out=seg)
+        t = process - self.cum[seg]
+        return seg, self.px[seg] + self.ux[seg] * t, self.py[seg] + self.uy[seg] * t
+
+    def positions(self, ahead):
+        # Screen positions of every row `ahead` seconds past the last step, as
+        # Enemy.render_pos would give them one by one (rows that would reach
+        # the end stay where they are). Indexed by slot.
+        if not ahead or self.lanes is None:
+            return self.x, self.y
+        x, y = self.x.copy(), self.y.copy()
+        live = np.flatnonzero(self.alive)
+        lane = self.lane[live]
+        process = self.process[live] + self.speed[live] * ahead
+        moving = process < self.total[lane]
+        live, process, lane = live[moving], process[moving], lane[moving]
+        _, x[live], y[live] = self.locate(process, lane)
+        return x, y
+
+    def damage(self, slots, amount):
+        # Clamped hit on every row in `slots`, returns what each row actually
+        # lost and the rows this hit killed (rows already at 0 are not
+        # reported again).
+        slots = np.asarray(slots, dtype=np.intp)
+        hp = self.hp[slots]
+        taken = np.minimum(hp, amount)
+        self.hp[slots] = hp - taken
+        return taken, slots[(hp > 0) & (hp - taken <= 0)]
+
+    def rebuild(self, items):
+        # Nothing to do: the arrays are the index, current after every step.
+        pass
+
+    def candidates(self, x, y, r, hidden=True):
+        mask = self.alive & (self.hp > 0)
+        if not hidden:
+            mask &= ~self.hidden
+        dx, dy = self.x - x, self.y - y
+        mask &= dx*dx + dy*dy <= r * r
+        return mask
+
+    def query(self, x, y, r):
+        # Distances for the rows in use only, not the whole capacity, which
+        # never shrinks after a big wave (hover picking asks every frame).
+        rows = np.flatnonzero(self.alive)
+        rows = rows[self.hp[rows] > 0]
+        dx, dy = self.x[rows] - x, self.y[rows] - y
+        rows = rows[dx*dx + dy*dy <= r * r]
+        views = self.views
+        return [views[slot] for slot in rows.tolist()]
+
+    def best(self, x, y, r, mode, hidden):
+        # Same modes and tie-break as SpatialHash.best: the row `mode` ranks
+        # highest, ties to the one furthest along the path, then to the one
+        # spawned first. Rows are not in spawn order, so that last step asks
+        # the views for their pool slot.
+        mask = self.candidates(x, y, r, hidden)
+        if not mask.any():
+            return None
+        if mode == "closest":
+            dx, dy = self.x - x, self.y - y
+            values = -(dx*dx + dy*dy)
+        elif mode == "first" or mode == "last":
+            values = self.process if mode == "first" else -self.process
+        else:
+            values = self.maxhp if mode == "strongest" else -self.maxhp
+        values = np.where(mask, values, -np.inf)
+        top = np.flatnonzero(values == values.max())
+        if top.size > 1 and mode != "first" and mode != "last":
+            process = self.process[top]
+            top = top[process == process.max()]
+        views = self.views
+        if top.size > 1:
+            return min((views[slot] for slot in top.tolist()), key=lambda e: e.pool_slot)
+        return views[int(top[0])]
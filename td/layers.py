@@ -0,0 +1,89 @@
+import pygame
+from render import sprites
+
+# Pixels that rarely change, kept off the per-frame path. The background holds
+# the road and every placed tower and is only repainted when the tower layout
+# changes, from a road picture drawn once per map; the HUD strip is only
+# re-rendered when a value it shows changes. A frame then costs one blit for
+# each instead of a clear, the road polyline, every tower rect and the HUD text.
+# The background and the placement tint follow the resolution of the surface
+# they are drawn on (a scaled-down world backbuffer, see backbuffer.py).
+
+class StaticLayer:
+    def __init__(self, size):
+        self.surface = pygame.Surface(size).convert()
+        self.road = pygame.Surface(size).convert()
+        self.level = None
+        self.key = None
+        self.rebuilds = 0
+
+    def draw(self, screen, sim):
+        size = screen.get_size()
+        if self.surface.get_size() != size:
+            self.surface = pygame.Surface(size).convert()
+            self.road = pygame.Surface(size).convert()
+            self.level = None
+        s = size[0] / sim.W
+        if self.level is not sim.level:
+            self.level = sim.level
+            self.key = None
+            self.road.fill("#000000")
+            for lane in sim.lanes:
+                pygame.draw.lines(self.road, "#494949", False, [(x * s, y * s) for x, y in lane.points],
+                                  max(1, round(5 * s)))
+        if self.key != sim.layout:
+            self.key = sim.layout
+            self.rebuilds += 1
+            surf = self.surface
+            surf.blit(self.road, (0, 0))
+            looks = sprites.looks(s)
+            batch = []
+            for tower in sim.towers:
+                key = ("tower", tower.name, tower.size, tower.col)
+                look = looks.get(key)
+                if look is None:
+                    look = sprites.box(looks, key, tower.size, tower.size, tower.col, s, tower.proto.sprite)
+                batch.append((look[0], (int(tower.rect[0] * s), int(tower.rect[1] * s))))
+            surf.blits(batch, False)
+        return screen.blit(self.surface, (0, 0))
+
+class HudLayer:
+    def __init__(self, rect, render):
+        self.rect = pygame.Rect(rect)
+        self.surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        self.render = render
+        self.key = None
+        self.rebuilds = 0
+
+    def draw(self, screen, key):
+        # `key` is the tuple of values on display; render(surface) paints them
+        # in layer coordinates.
+        if key != self.key:
+            self.key = key
+            self.rebuilds += 1
+            self.surface.fill((0, 0, 0, 0))
+            self.render(self.surface)
+        return screen.blit(self.surface, self.rect)
+
+class MaskLayer:
+    # The placement mask tinted into a full-screen overlay: built at cell
+    # resolution from the mask bytes and scaled up once per mask version and
+    # target resolution.
+    def __init__(self, color=(255, 0, 0, 70)):
+        self.color = color
+        self.surface = None
+        self.key = None
+        self.rebuilds = 0
+
+    def draw(self, screen, mask):
+        s = screen.get_width() / mask.W
+        if self.key != (mask.version, s):
+            self.key = (mask.version, s)
+            self.rebuilds += 1
+            on = bytes(self.color)
+            off = bytes(4)
+            pixels = b"".join(on if r or t else off for r, t in zip(mask.road, mask.towers))
+            small = pygame.image.frombuffer(pixels, (mask.cols, mask.rows), "RGBA")
+            size = (round(mask.cols * mask.cell * s), round(mask.rows * mask.cell * s))
+            self.surface = pygame.transform.scale(small, size).convert_alpha()
+        return screen.blit(self.surface, (0, 0))
@@ -0,0 +1,99 @@
+import bisect, hashlib, json, os, struct, zlib
+from path import Path
+from placement import PlacementMask
+
+# Maps from templates.json: named lanes (polylines in the map's design
+# resolution) and which lanes each wave sends enemies down. A map is compiled
+# once per process for a given screen size: a Path per lane and the road
+# raster of the placement mask. The raster is the slow part (every cell near
+# every segment is measured), so it is also kept on disk, keyed by a hash of
+# the map and the raster settings; a changed map simply misses the cache.
+#
+#   "maps": {"classic": {"size": [1920, 1080], "lanes": {"main": [[x, y], ...]},
+#                        "waves": {"1": ["main"]}}}
+#
+# A map may also be given as the name of a JSON file next to templates.json.
+
+MAGIC = b"TDMP"
+VERSION = 1
+HEADER = struct.Struct("<4sHII")
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapcache")
+
+compiled = {}
+
+def resolve(maps, base):
+    out = {}
+    for name, spec in maps.items():
+        if isinstance(spec, str):
+            with open(os.path.join(base, spec), "r") as f:
+                spec = json.load(f)
+        out[name] = spec
+    return out
+
+class Lane:
+    def __init__(self, index, name, points):
+        self.index = index
+        self.name = name
+        self.points = points
+        self.path = Path(points)
+
+class Map:
+    def __init__(self, name, spec, W, H, cell=8, road=45):
+        self.name = name
+        self.W, self.H = W, H
+        self.cell = cell
+        self.road_width = road
+        sw, sh = spec.get("size", (W, H))
+        self.lanes = []
+        for lane, points in spec["lanes"].items():
+            self.lanes.append(Lane(len(self.lanes), lane, [(x * W / sw, y * H / sh) for x, y in points]))
+        index = {lane.name: lane.index for lane in self.lanes}
+        everyone = [lane.index for lane in self.lanes]
+        # (first wave, lane indices) pairs, each holding until the next one.
+        self.starts = [0]
+        self.assign = [everyone]
+        for wave, lanes in sorted((int(k), v) for k, v in spec.get("waves", {}).items()):
+            if wave in self.starts:
+                self.assign[self.starts.index(wave)] = [index[lane] for lane in lanes]
+            else:
+                self.starts.append(wave)
+                self.assign.append([index[lane] for lane in lanes])
+        self.key = hashlib.sha1(json.dumps([VERSION, W, H, cell, road, spec.get("size"), spec["lanes"]],
+                                           sort_keys=True).encode()).hexdigest()
+        self.road = self.load_road()
+
+    def lanes_for(self, wave):
+        return self.assign[bisect.bisect_right(self.starts, wave) - 1]
+
+    def load_road(self):
+        path = os.path.join(CACHE_DIR, self.key + ".tdm")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            magic, version, cols, rows = HEADER.unpack_from(data, 0)
+            road = zlib.decompress(data[HEADER.size:])
+            if magic == MAGIC and version == VERSION and len(road) == cols * rows:
+                return road
+        except (OSError, struct.error, zlib.error):
+            pass
+        mask = PlacementMask(self.W, self.H, [lane.path for lane in self.lanes], self.cell, self.road_width)
+        road = bytes(mask.road)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, mask.cols, mask.rows) + zlib.compress(road, 6))
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+        return road
+
+    def placement(self):
+        # A fresh mask for one game, with the road already filled in.
+        return PlacementMask(self.W, self.H, None, self.cell, self.road_width, raster=self.road)
+
+def load(name, spec, W, H):
+    key = (name, json.dumps(spec, sort_keys=True), W, H)
+    level = compiled.get(key)
+    if level is None:
+        level = compiled[key] = Map(name, spec, W, H)
+    return level
@@ -0,0 +1,83 @@
+import csv, json
+
+# Per-tower, per-wave telemetry. The simulation only calls in here when a
+# Metrics is attached (Simulation.metrics), so plain runs pay one None check
+# per tower update. Rows are keyed by wave and tower id:
+#
+#   shots     attacks fired (a splash shell counts when launched)
+#   damage    HP actually removed from enemies
+#   overkill  damage that landed on less HP than it carried
+#   idle      seconds spent with nothing to aim at
+#   income    money-tower payouts
+#
+#   python balance.py --metrics --out sweep.json
+
+FIELDS = ("shots", "damage", "overkill", "idle", "income")
+SHOTS, DAMAGE, OVERKILL, IDLE, INCOME = range(5)
+
+class Metrics:
+    def __init__(self):
+        self.waves = {}
+        self.names = {}
+
+    def row(self, wave, tower):
+        rows = self.waves.get(wave)
+        if rows is None:
+            rows = self.waves[wave] = {}
+        row = rows.get(tower.id)
+        if row is None:
+            row = rows[tower.id] = [0, 0, 0, 0.0, 0]
+            self.names[tower.id] = tower.name
+        return row
+
+    def shot(self, wave, tower):
+        self.row(wave, tower)[SHOTS] += 1
+
+    def idle(self, wave, tower, dt):
+        self.row(wave, tower)[IDLE] += dt
+
+    def damage(self, wave, tower, dealt, taken):
+        row = self.row(wave, tower)
+        row[DAMAGE] += taken
+        row[OVERKILL] += dealt - taken
+
+    def income(self, wave, tower, amount):
+        self.row(wave, tower)[INCOME] += amount
+
+    def totals(self, wave=None):
+        # {tower id: [shots, damage, overkill, idle, income]} for one wave, or
+        # summed over the whole game.
+        if wave is not None:
+            return self.waves.get(wave, {})
+        out = {}
+        for rows in self.waves.values():
+            for tid, row in rows.items():
+                acc = out.get(tid)
+                if acc is None:
+                    out[tid] = list(row)
+                else:
+                    for i, v in enumerate(row):
+                        acc[i] += v
+        return out
+
+    def rows(self):
+        for wave in sorted(self.waves):
+            for tid, row in sorted(self.waves[wave].items()):
+                yield dict(zip(("wave", "tower", "name") + FIELDS, (wave, tid, self.names[tid], *row[:IDLE],
+                                                                    round(row[IDLE], 3), row[INCOME])))
+
+    def write_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(("wave", "tower", "name") + FIELDS)
+        for r in self.rows():
+            writer.writerow(r.values())
+
+    def write_json(self, f):
+        json.dump(list(self.rows()), f, separators=(",", ":"))
+
+    def save(self, path):
+        with open(path, "w", newline="") as f:
+            if path.endswith(".json"):
+                self.write_json(f)
+            else:
+                self.write_csv(f)
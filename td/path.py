@@ -0,0 +1,55 @@
+import bisect, math
+
+# The enemy route compiled once into segments with cumulative lengths. An
+# enemy's whole movement state is its distance along the route, its screen
+# position is a lookup into the segment that distance falls in.
+
+class Path:
+    def __init__(self, points):
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.cum = [0.0]
+        self.ux = []
+        self.uy = []
+        for (x0, y0), (x1, y1) in zip(self.points, self.points[1:]):
+            length = math.hypot(x1 - x0, y1 - y0)
+            self.cum.append(self.cum[-1] + length)
+            if length:
+                self.ux.append((x1 - x0) / length)
+                self.uy.append((y1 - y0) / length)
+            else:
+                self.ux.append(0.0)
+                self.uy.append(0.0)
+        self.total = self.cum[-1]
+        self.segments = len(self.points) - 1
+
+    def segment(self, d, seg=0):
+        # Segment holding distance d. Enemies only move forward, so starting
+        # from their last segment this is amortized O(1); seg=None bisects.
+        cum = self.cum
+        last = self.segments - 1
+        if seg is None:
+            return max(0, min(last, bisect.bisect_right(cum, d) - 1))
+        while seg < last and cum[seg + 1] <= d:
+            seg += 1
+        return seg
+
+    def locate(self, d, seg=0):
+        seg = self.segment(d, seg)
+        x, y = self.points[seg]
+        t = d - self.cum[seg]
+        return seg, x + self.ux[seg] * t, y + self.uy[seg] * t
+
+    def position(self, d):
+        return self.locate(d, None)[1:]
+
+    def distance(self, x, y):
+        # Shortest distance from (x, y) to the road centre line.
+        best = None
+        for seg in range(self.segments):
+            x0, y0 = self.points[seg]
+            t = (x - x0) * self.ux[seg] + (y - y0) * self.uy[seg]
+            t = max(0.0, min(self.cum[seg + 1] - self.cum[seg], t))
+            d = math.hypot(x - x0 - self.ux[seg] * t, y - y0 - self.uy[seg] * t)
+            if best is None or d < best:
+                best = d
+        return best
@@ -0,0 +1,72 @@
+import math
+
+# Low-resolution placement bitmap. The road buffer is rasterized once; every
+# tower stamps a reference count into the cells within `spacing` of it when
+# placed and takes it back when sold. A cursor check is then one lookup instead
+# of a distance test against every road segment and every tower. `version`
+# changes on every stamp so drawn overlays know when to rebuild. A road raster
+# computed earlier for the same map (see maps.py) can be passed in instead of
+# the lane paths.
+
+class PlacementMask:
+    def __init__(self, W, H, paths, cell=8, road=45, spacing=80, raster=None):
+        self.W, self.H = W, H
+        self.cell = cell
+        self.spacing = spacing
+        self.cols = int(math.ceil(W / cell))
+        self.rows = int(math.ceil(H / cell))
+        self.towers = bytearray(self.cols * self.rows)
+        self.version = 0
+        if raster is not None:
+            self.road = bytearray(raster)
+        else:
+            self.road = bytearray(self.cols * self.rows)
+            for path in paths:
+                self.rasterize_road(path, road)
+
+    def cells_near(self, x, y, r):
+        # Indices of the cells whose centre lies within r of (x, y).
+        c = self.cell
+        c0, c1 = max(0, int((x - r) // c)), min(self.cols - 1, int((x + r) // c))
+        r0, r1 = max(0, int((y - r) // c)), min(self.rows - 1, int((y + r) // c))
+        rr = r * r
+        for row in range(r0, r1 + 1):
+            dy = (row + 0.5) * c - y
+            for col in range(c0, c1 + 1):
+                dx = (col + 0.5) * c - x
+                if dx*dx + dy*dy < rr:
+                    yield row * self.cols + col
+
+    def rasterize_road(self, path, width):
+        # Only the cells in each segment's padded bounding box are measured.
+        c = self.cell
+        road = self.road
+        for seg in range(path.segments):
+            (x0, y0), (x1, y1) = path.points[seg], path.points[seg + 1]
+            length = path.cum[seg + 1] - path.cum[seg]
+            ux, uy = path.ux[seg], path.uy[seg]
+            c0, c1 = max(0, int((min(x0, x1) - width) // c)), min(self.cols - 1, int((max(x0, x1) + width) // c))
+            r0, r1 = max(0, int((min(y0, y1) - width) // c)), min(self.rows - 1, int((max(y0, y1) + width) // c))
+            for row in range(r0, r1 + 1):
+                py = (row + 0.5) * c
+                for col in range(c0, c1 + 1):
+                    px = (col + 0.5) * c
+                    t = max(0.0, min(length, (px - x0) * ux + (py - y0) * uy))
+                    if math.hypot(px - x0 - ux * t, py - y0 - uy * t) < width:
+                        road[row * self.cols + col] = 1
+        self.version += 1
+
+    def stamp(self, x, y, amount=1):
+        towers = self.towers
+        for i in self.cells_near(x, y, self.spacing):
+            towers[i] = max(0, min(255, towers[i] + amount))
+        self.version += 1
+
+    def clear(self, x, y):
+        self.stamp(x, y, -1)
+
+    def valid(self, x, y):
+        if not (0 <= x < self.W and 0 <= y < self.H):
+            return False
+        i = int(y // self.cell) * self.cols + int(x // self.cell)
+        return not (self.road[i] or self.towers[i])
@@ -0,0 +1,88 @@
+# Slot-indexed entity container. Each entity remembers its slot, so removal
+# just leaves a tombstone (None) in O(1) and appending is a plain list append.
+# Iteration walks the slots in order and skips tombstones, so entities dying
+# mid-loop never shift the list under the loop; entities appended mid-loop
+# (spawner children) are visited by the same loop, as a growing list would.
+# compact() squeezes the tombstones out once per tick.
+
+class Pool:
+    def __init__(self):
+        self.items = []
+        self.dead = 0
+
+    def append(self, item):
+        item.pool_slot = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item):
+        slot = item.pool_slot
+        if slot is not None and slot < len(self.items) and self.items[slot] is item:
+            self.items[slot] = None
+            item.pool_slot = None
+            self.dead += 1
+
+    def __contains__(self, item):
+        slot = getattr(item, "pool_slot", None)
+        return slot is not None and slot < len(self.items) and self.items[slot] is item
+
+    def __iter__(self):
+        items = self.items
+        i = 0
+        while i < len(items):
+            item = items[i]
+            if item is not None:
+                yield item
+            i += 1
+
+    def __len__(self):
+        return len(self.items) - self.dead
+
+    def __bool__(self):
+        return len(self.items) > self.dead
+
+    def compact(self):
+        if not self.dead:
+            return
+        items = [i for i in self.items if i is not None]
+        for slot, item in enumerate(items):
+            item.pool_slot = slot
+        self.items = items
+        self.dead = 0
+
+    def clear(self):
+        for item in self.items:
+            if item is not None:
+                item.pool_slot = None
+        self.items = []
+        self.dead = 0
+
+class FreeList:
+    # Recycler for short-lived records (blast shells, effect rings): released
+    # instances are kept, up to `capacity`, and handed back out by acquire()
+    # through their reset() instead of allocating a new object. The counters
+    # show how many constructions the hot path still does.
+    def __init__(self, factory, capacity=256):
+        self.factory = factory
+        self.capacity = capacity
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        self.dropped = 0
+
+    def acquire(self, *args):
+        if self.free:
+            self.reused += 1
+            obj = self.free.pop()
+            obj.reset(*args)
+            return obj
+        self.created += 1
+        return self.factory(*args)
+
+    def release(self, obj):
+        if len(self.free) < self.capacity:
+            self.free.append(obj)
+        else:
+            self.dropped += 1
+
+    def stats(self):
+        return {"created": self.created, "reused": self.reused, "dropped": self.dropped, "free": len(self.free)}
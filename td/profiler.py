@@ -0,0 +1,61 @@
+import csv, json, time
+from collections import deque
+
+# Frame-time breakdown. The main loop and Simulation.tick call mark(phase) at
+# the end of each phase; the time since the previous mark is charged to that
+# phase, so sim phases add up over however many substeps ran this frame. A
+# rolling window feeds the p50/p95/p99 overlay, and with log=True every frame
+# is kept for save() on exit.
+#
+#   TD_PROFILE=1 python main.py     (P toggles the overlay at any time)
+
+PHASES = ("events", "waves", "enemies", "targeting", "projectiles", "damage", "temporary", "world", "hud", "flip")
+
+class Profiler:
+    def __init__(self, window=300, log=False):
+        self.history = {name: deque(maxlen=window) for name in PHASES + ("frame",)}
+        self.frame = dict.fromkeys(PHASES, 0.0)
+        self.counts = {}
+        self.log = [] if log else None
+        self.frames = 0
+        self.last = time.perf_counter()
+
+    def start(self):
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.frame[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, **counts):
+        frame = self.frame
+        total = 0.0
+        for name in PHASES:
+            ms = frame[name] * 1000
+            total += ms
+            self.history[name].append(ms)
+        self.history["frame"].append(total)
+        if self.log is not None:
+            self.log.append((self.frames, round(total, 4), *(round(frame[n] * 1000, 4) for n in PHASES), *counts.values()))
+        self.counts = counts
+        self.frame = dict.fromkeys(PHASES, 0.0)
+        self.frames += 1
+
+    def percentiles(self, phase, qs=(50, 95, 99)):
+        data = sorted(self.history[phase])
+        if not data:
+            return (0.0,) * len(qs)
+        return tuple(data[min(len(data) - 1, len(data) * q // 100)] for q in qs)
+
+    def summary(self):
+        return {name: dict(zip(("p50", "p95", "p99"), self.percentiles(name))) for name in ("frame",) + PHASES}
+
+    def save(self, path):
+        with open(path, "w", newline="") as f:
+            if path.endswith(".json"):
+                json.dump({"summary": self.summary(), "frames": self.log}, f, separators=(",", ":"))
+                return
+            writer = csv.writer(f)
+            writer.writerow(("frame", "total") + PHASES + tuple("n_" + key for key in self.counts))
+            writer.writerows(self.log or ())
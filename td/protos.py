@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+# templates.json compiled once into immutable prototype records. Towers and
+# enemies keep a reference to their prototype instead of digging through the
+# raw template dicts (and their optional "attributes") on every construction
+# and every step; the flags the hot paths branch on are precomputed here.
+
+EnemyProto = namedtuple("EnemyProto", "name maxhp color speed size hidden spawn death_spawn death_quantity "
+                                      "has_spawner has_death_spawn sprite tags")
+SpawnProto = namedtuple("SpawnProto", "name quantity cooldown spawnrate")
+TowerProto = namedtuple("TowerProto", "name color damage firerate range mode upgrades hidden dmgtype radius "
+                                      "cost aoeangle money_tower sprite")
+UpgradeProto = namedtuple("UpgradeProto", "name desc price damage range firerate detection")
+
+def compile_enemy(name, full):
+    attributes = full.get("attributes", {})
+    spawn = attributes.get("spawn")
+    if spawn is not None:
+        spawn = SpawnProto(spawn["name"], spawn["quantity"], spawn["cooldown"], spawn["spawnrate"])
+    death_spawn = tuple(attributes.get("death_spawn", ()))
+    death_quantity = attributes.get("quantity", 0)
+    hidden = full.get("hidden", False)
+    # Registry tags (see registry.py): the template's own plus the derived ones.
+    tags = list(full.get("tags", ()))
+    if hidden:
+        tags.append("hidden")
+    if spawn is not None:
+        tags.append("spawner")
+    return EnemyProto(name, full["maxhealth"], full["color"], full["speed"], full["size"], hidden,
+                      spawn, death_spawn, death_quantity, spawn is not None, bool(death_spawn or death_quantity),
+                      full.get("sprite"), tuple(tags))
+
+def compile_upgrade(full):
+    # Zero means "unchanged", as the upgrade code has always treated a missing
+    # stat; detection stays None unless the upgrade sets it.
+    return UpgradeProto(full.get("name", ""), full.get("desc", ""), full["price"], full.get("damage", 0),
+                        full.get("range", 0), full.get("firerate", 0), full.get("detection"))
+
+def compile_tower(name, full):
+    attributes = full.get("attributes", {})
+    return TowerProto(name, full["color"], full["damage"], full["firerate"], full["range"], full.get("mode", "first"),
+                      tuple(compile_upgrade(u) for u in full["upgrades"]), bool(attributes.get("detection", False)),
+                      attributes.get("damage_type", "normal"), full.get("blastradius", None), full["cost"],
+                      full.get("aoeangle", 0), attributes.get("money_tower", False), full.get("sprite"))
+
+def compile_templates(towers, enemies):
+    return ({name: compile_tower(name, full) for name, full in towers.items()},
+            {name: compile_enemy(name, full) for name, full in enemies.items()})
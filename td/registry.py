@@ -0,0 +1,23 @@
+# Live entities by tag (boss, hidden, spawner, plus any "tags" a template
+# lists), kept up to date as enemies spawn and are removed. Lookups such as
+# "is a boss on the field" or "every spawner" then cost the size of the answer
+# rather than a scan over every enemy. Each tag is an insertion-ordered dict
+# used as a set, so iteration follows spawn order like the enemy pool.
+
+class Registry:
+    def __init__(self):
+        self.tags = {}
+
+    def add(self, entity, tags):
+        for tag in tags:
+            bucket = self.tags.get(tag)
+            if bucket is None:
+                bucket = self.tags[tag] = {}
+            bucket[entity] = None
+
+    def remove(self, entity, tags):
+        for tag in tags:
+            self.tags[tag].pop(entity, None)
+
+    def get(self, tag):
+        return tuple(self.tags.get(tag, ()))
@@ -0,0 +1,48 @@
+from sprites import SpriteCache
+
+# Drawing of the moving world (enemies, effect rings, blast shells), shared by
+# main.py and the headless render benchmark. `ahead` is how far past the last
+# simulation tick to extrapolate positions. The world is drawn at whatever
+# resolution `screen` has relative to the map (see backbuffer.py), every
+# entity as a cached sprite through a single blits call.
+
+sprites = SpriteCache()
+
+def draw_world(screen, sim, ahead):
+    s = screen.get_width() / sim.W
+    looks = sprites.looks(s)
+    batch = []
+    add = batch.append
+    if sim.table is not None:
+        # Table rows are extrapolated all at once instead of per view.
+        xs, ys = sim.table.positions(ahead)
+        xs, ys = (xs * s).tolist(), (ys * s).tolist()
+        for enemy in sim.enemies:
+            key = (enemy.name, enemy.size, enemy.col)
+            look = looks.get(key)
+            if look is None:
+                look = sprites.circle(looks, key, enemy.size, enemy.col, s, enemy.proto.sprite)
+            slot = enemy.slot
+            add((look[0], (int(xs[slot] - look[1]), int(ys[slot] - look[2]))))
+    else:
+        for enemy in sim.enemies:
+            ex, ey = enemy.render_pos(ahead)
+            key = (enemy.name, enemy.size, enemy.col)
+            look = looks.get(key)
+            if look is None:
+                look = sprites.circle(looks, key, enemy.size, enemy.col, s, enemy.proto.sprite)
+            add((look[0], (int(ex * s - look[1]), int(ey * s - look[2]))))
+    for obj in sim.temporary:
+        key = ("ring", obj.radius, obj.color)
+        look = looks.get(key)
+        if look is None:
+            look = sprites.ring(looks, key, obj.radius, obj.color, s)
+        add((look[0], (int(obj.pos[0] * s - look[1]), int(obj.pos[1] * s - look[2]))))
+    for obj in sim.projectiles:
+        x, y, w, h = obj.render_rect(ahead)
+        key = ("shell", w, h, obj.col)
+        look = looks.get(key)
+        if look is None:
+            look = sprites.box(looks, key, w, h, obj.col, s)
+        add((look[0], (int(x * s), int(y * s))))
+    screen.blits(batch, False)
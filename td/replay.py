@@ -0,0 +1,117 @@
+import hashlib, struct, sys
+import sim
+from sim import PLACE, UPGRADE, SELL, MODE, SKIP, SPEED
+
+# Compact binary log of player actions, stamped with the simulation tick they
+# were applied before. Together with the game seed, the map and the fixed step
+# this is enough to replay a session tick for tick.
+#
+#   python replay.py last_replay.tdr
+
+MAGIC = b"TDRL"
+VERSION = 2
+HEADER = struct.Struct("<4sHQBBdII")
+RECORD = struct.Struct("<IB")
+
+PAYLOADS = {
+    PLACE: struct.Struct("<Bdd"),
+    UPGRADE: struct.Struct("<H"),
+    SELL: struct.Struct("<H"),
+    MODE: struct.Struct("<H"),
+    SKIP: struct.Struct("<"),
+    SPEED: struct.Struct("<H"),
+}
+
+class InputLog:
+    def __init__(self, seed, use_table=False, step=1/60, map_name=None):
+        self.seed = seed
+        self.use_table = use_table
+        self.step = step
+        self.map_name = map_name or sim.defaultMap
+        self.ticks = 0
+        self.records = []
+
+    def record(self, tick, code, *args):
+        self.records.append((tick, code, args))
+
+    def to_bytes(self):
+        names = list(sim.towerTemp)
+        out = [HEADER.pack(MAGIC, VERSION, self.seed, self.use_table, list(sim.mapTemp).index(self.map_name), self.step,
+                           self.ticks, len(self.records))]
+        for tick, code, args in self.records:
+            if code == PLACE:
+                args = (names.index(args[0]), args[1], args[2])
+            out.append(RECORD.pack(tick, code) + PAYLOADS[code].pack(*args))
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, seed, use_table, level, step, ticks, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a td replay log")
+        log = cls(seed, bool(use_table), step, list(sim.mapTemp)[level])
+        log.ticks = ticks
+        names = list(sim.towerTemp)
+        pos = HEADER.size
+        for _ in range(count):
+            tick, code = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            args = PAYLOADS[code].unpack_from(data, pos)
+            pos += PAYLOADS[code].size
+            if code == PLACE:
+                args = (names[args[0]], args[1], args[2])
+            log.records.append((tick, code, args))
+        return log
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+def apply(game, code, args):
+    if code == PLACE:
+        name, x, y = args
+        game.place_tower(x, y, name)
+    elif code == SKIP:
+        game.skip_wave()
+    elif code == SPEED:
+        game.set_speed(args[0])
+    else:
+        tower = game.tower_by_id(args[0])
+        if code == UPGRADE:
+            game.upgrade_tower(tower)
+        elif code == SELL:
+            game.sell_tower(tower)
+        elif code == MODE:
+            game.toggle_mode(tower)
+
+def replay(log, ticks=None):
+    game = sim.Simulation(use_table=log.use_table, seed=log.seed, map_name=log.map_name)
+    records = log.records
+    ticks = log.ticks if ticks is None else ticks
+    i = 0
+    while game.ticks < ticks and not game.over:
+        while i < len(records) and records[i][0] <= game.ticks:
+            apply(game, records[i][1], records[i][2])
+            i += 1
+        game.tick(log.step)
+    return game
+
+def state_digest(game):
+    h = hashlib.sha1()
+    h.update(repr((game.ticks, game.money, game.wave, game.base.hp, game.end, game.over)).encode())
+    for e in game.enemies:
+        h.update(repr((e.name, e.lane, e.hp, round(e.process, 6))).encode())
+    for t in game.towers:
+        h.update(repr((t.id, t.name, t.lvl, t.mode, t.totaldmg)).encode())
+    return h.hexdigest()
+
+if __name__ == "__main__":
+    log = InputLog.load(sys.argv[1])
+    game = replay(log)
+    print(f"{log.map_name}: {len(log.records)} actions, {game.ticks} ticks, wave {game.wave}, money {game.money}, "
+          f"base {game.base.hp}, digest {state_digest(game)}")
@@ -0,0 +1,664 @@
+import json, os, random, math
+from spatial import SpatialHash, TARGET_MODES
+from enemytable import EnemyTable, HAS_NUMPY
+from pool import Pool, FreeList
+import maps
+from waves import compile_route, WaveScheduler, SPAWN, WAVE_END, WAVE_START
+from protos import compile_templates
+from registry import Registry
+
+# Simulation core for td. Nothing in here touches pygame or a display, so the
+# game can be advanced headless (balancing scripts, CI) with Simulation.tick(dt)
+# and main.py only reads the state back to draw it.
+
+# Player actions, as recorded into Simulation.log (see replay.py).
+PLACE, UPGRADE, SELL, MODE, SKIP, SPEED = range(6)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_templates(path=None):
+    if path is None:
+        path = os.path.join(HERE, "templates.json")
+        if not os.path.exists(path):
+            path = "templates.json"
+    with open(path, "r") as f:
+        full = json.load(f)
+    mapTemp = maps.resolve(full["maps"], os.path.dirname(os.path.abspath(path)))
+    return full["towers"], full["enemies"], full["route"], mapTemp, full["default_map"]
+
+towerTemp, enemyTemp, route, mapTemp, defaultMap = load_templates()
+towerProto, enemyProto = compile_templates(towerTemp, enemyTemp)
+waves = compile_route(route)
+
+def use_templates(path):
+    # Swap the templates every new Simulation in this process is built from
+    # (balance sweeps run variants of templates.json).
+    global towerTemp, enemyTemp, route, mapTemp, defaultMap, towerProto, enemyProto, waves
+    towerTemp, enemyTemp, route, mapTemp, defaultMap = load_templates(path)
+    towerProto, enemyProto = compile_templates(towerTemp, enemyTemp)
+    waves = compile_route(route)
+
+class Base:
+    def __init__(self, sim):
+        self.sim = sim
+        self.maxhp = 300
+        self.hp = self.maxhp
+
+    def decrease_hp(self, amount):
+        self.hp -= amount
+        if self.hp <= 0:
+            self.hp = 0
+            self.sim.game_over()
+
+    def increase_hp(self, amount):
+        self.hp += amount
+        if self.hp > self.maxhp:
+            self.hp = self.maxhp
+
+class Effect:
+    # A fading ring drawn for `time` more seconds (blasts, money payouts).
+    __slots__ = ("color", "pos", "radius", "time")
+
+    def __init__(self, color, pos, radius, time):
+        self.reset(color, pos, radius, time)
+
+    def reset(self, color, pos, radius, time):
+        self.color = color
+        self.pos = pos
+        self.radius = radius
+        self.time = time
+
+class BlastProjectile:
+    # Recycled through Simulation.shells: build them with Simulation.launch().
+    __slots__ = ("sim", "tx", "ty", "x", "y", "col", "radius", "dmg", "size", "parent", "speed", "dirx", "diry",
+                 "pool_slot")
+
+    def __init__(self, sim, targetx, targety, currentx, currenty, blastradius, damage, color, size, parent):
+        self.reset(sim, targetx, targety, currentx, currenty, blastradius, damage, color, size, parent)
+
+    def reset(self, sim, targetx, targety, currentx, currenty, blastradius, damage, color, size, parent):
+        self.sim = sim
+        self.tx, self.ty = targetx, targety
+        self.x, self.y = currentx, currenty
+        self.col = color
+        self.radius = blastradius
+        self.dmg = damage
+        self.size = size
+        self.parent = parent
+        self.speed = 500
+        dx = targetx - currentx
+        dy = targety - currenty
+        length = (dx**2 + dy**2)**0.5
+        if length != 0:
+            self.dirx, self.diry = dx/length, dy/length
+        else:
+            self.dirx, self.diry = 0, 0
+
+    def render_rect(self, ahead):
+        x = self.x + self.dirx * self.speed * ahead
+        y = self.y + self.diry * self.speed * ahead
+        return (x - self.size/2, y - self.size/2, self.size, self.size)
+
+    def boom(self):
+        sim = self.sim
+        sim.add_effect("#ffffff", (self.x, self.y), self.radius, 0.2)
+        hit = [i for i in sim.grid.query(self.x, self.y, self.radius) if i.hp > 0]
+        sim.damage_many(hit, self.dmg, self.parent)
+        sim.projectiles.remove(self)
+        sim.shells.release(self)
+
+    def update(self, dt):
+        self.x += self.dirx * self.speed * dt
+        self.y += self.diry * self.speed * dt
+        dx = self.tx - self.x
+        dy = self.ty - self.y
+        length = (dx**2 + dy**2)**0.5
+        if length < self.speed*dt:
+            self.boom()
+
+class Enemy:
+    __slots__ = ("sim", "proto", "maxhp", "col", "speed", "hp", "size", "name", "lane", "path", "idx", "x", "y",
+                 "process", "hidden", "spawn_timer", "spawn_queue", "spawn_delay_timer", "pool_slot")
+
+    def __init__(self, sim, enemy, lane=0):
+        proto = enemyProto.get(enemy)
+        if proto is None:
+            raise ValueError(f"\"{enemy}\" enemy is not in enemy templates.")
+        self.sim = sim
+        self.proto = proto
+        self.maxhp = proto.maxhp
+        self.col = proto.color
+        self.speed = proto.speed
+        self.hp = proto.maxhp
+        self.size = proto.size
+        self.name = enemy
+        self.lane = lane
+        self.path = sim.lanes[lane].path
+        self.idx = 0
+        self.x, self.y = self.path.points[0]
+        self.process = 0
+        self.hidden = proto.hidden
+        self.spawn_timer = proto.spawn.cooldown if proto.has_spawner else 0
+        self.spawn_queue = 0
+        self.spawn_delay_timer = 0
+
+    def collidepoint(self, pos):
+        half = self.size/2
+        return self.x - half <= pos[0] < self.x + half and self.y - half <= pos[1] < self.y + half
+
+    def spawn_step(self, dt):
+        spawn = self.proto.spawn
+        self.spawn_timer -= dt
+        if self.spawn_timer <= 0:
+            self.spawn_queue = spawn.quantity
+            self.spawn_timer = spawn.cooldown
+        if self.spawn_queue > 0:
+            self.spawn_delay_timer -= dt
+            if self.spawn_delay_timer <= 0:
+                self.sim.spawn_enemy(spawn.name, self)
+                self.spawn_queue -= 1
+                self.spawn_delay_timer = spawn.spawnrate
+
+    def step(self, dt):
+        sim = self.sim
+        if self.proto.has_spawner:
+            self.spawn_step(dt)
+
+        self.process += self.speed * dt
+        if self.process >= self.path.total:
+            sim.remove_enemy(self)
+            sim.base.decrease_hp(self.hp)
+            return
+        self.idx, self.x, self.y = self.path.locate(self.process, self.idx)
+
+    def render_pos(self, ahead):
+        # Where the enemy will be `ahead` sim-seconds after the last tick.
+        if not ahead:
+            return self.x, self.y
+        path = self.path
+        d = self.process + self.speed * ahead
+        if d >= path.total:
+            return self.x, self.y
+        return path.locate(d, self.idx)[1:]
+
+    def place(self, process):
+        self.process = process
+        self.idx, self.x, self.y = self.path.locate(process, None)
+
+    def die(self):
+        sim = self.sim
+        proto = self.proto
+        if proto.has_death_spawn:
+            if proto.death_spawn:
+                random_enemy_name = sim.rng.choice(proto.death_spawn)
+                sim.spawn_enemy(random_enemy_name, self)
+            for i in range(proto.death_quantity):
+                sim.spawn_enemy("Goo", self)
+        sim.remove_enemy(self)
+
+def table_column(name, cast):
+    def get(self):
+        return cast(getattr(self.table, name)[self.slot])
+    def set(self, value):
+        getattr(self.table, name)[self.slot] = value
+    return property(get, set)
+
+class TableEnemy(Enemy):
+    # Thin view over one EnemyTable row, so hover/HP readers keep using
+    # enemy.x, enemy.hp etc. while the table does the per-tick work.
+    x = table_column("x", float)
+    y = table_column("y", float)
+    hp = table_column("hp", int)
+    maxhp = table_column("maxhp", int)
+    speed = table_column("speed", float)
+    lane = table_column("lane", int)
+    idx = table_column("idx", int)
+    process = table_column("process", float)
+    hidden = table_column("hidden", bool)
+    __slots__ = ("table", "slot")
+
+    def __init__(self, sim, enemy, lane=0):
+        self.table = sim.table
+        self.slot = self.table.add(self)
+        try:
+            Enemy.__init__(self, sim, enemy, lane)
+        except ValueError:
+            self.table.release(self.slot)
+            raise
+
+class Tower:
+    __slots__ = ("sim", "proto", "id", "size", "x", "y", "name", "col", "dmg", "frate", "range", "rect", "waittime",
+                 "mode", "upgs", "hidden", "dmgtype", "radius", "lvl", "nextupgradeprice", "totaldmg", "cost",
+                 "sellprice", "maxlvl", "aoeangle", "angle", "is_money_tower")
+
+    def __init__(self, sim, x, y, tower):
+        proto = towerProto.get(tower)
+        if proto is None:
+            raise ValueError(f"\"{tower}\" tower not in tower templates.")
+        self.size = 50
+        self.sim = sim
+        self.proto = proto
+        self.id = None
+        self.x = x
+        self.y = y
+        self.name = tower
+        self.col = proto.color
+        self.dmg = proto.damage
+        self.frate = proto.firerate
+        self.range = proto.range
+        self.rect = (x - self.size/2, y - self.size/2, self.size, self.size)
+        self.waittime = 0
+        self.mode = proto.mode
+        self.upgs = proto.upgrades
+        self.hidden = proto.hidden
+        self.dmgtype = proto.dmgtype
+        self.radius = proto.radius
+        self.lvl = 0
+        self.nextupgradeprice = self.upgs[self.lvl].price
+        self.totaldmg = 0
+        self.cost = proto.cost
+        self.sellprice = self.cost*0.7
+        self.maxlvl = len(self.upgs)
+        self.aoeangle = proto.aoeangle
+        self.angle = 0  # Kulenin o an baktığı yön
+        self.is_money_tower = proto.money_tower
+
+    def collidepoint(self, pos):
+        half = self.size/2
+        return self.x - half <= pos[0] < self.x + half and self.y - half <= pos[1] < self.y + half
+
+    def upgrade(self):
+        sim = self.sim
+        if sim.money < self.nextupgradeprice:
+            return
+        sim.dec_money(self.nextupgradeprice)
+        self.level_up()
+
+    def level_up(self):
+        # The stat changes of the next upgrade, without charging for it
+        # (snapshot restore rebuilds levels this way).
+        mustupgrade = self.upgs[self.lvl]
+        if mustupgrade.damage > 0:
+            self.dmg = mustupgrade.damage
+        if mustupgrade.range > 0:
+            self.range = mustupgrade.range
+        if mustupgrade.firerate > 0:
+            self.frate = mustupgrade.firerate
+        if mustupgrade.detection is not None:
+            self.hidden = mustupgrade.detection
+        self.lvl += 1
+        self.sellprice += int(mustupgrade.price*0.7)
+        if self.lvl != self.maxlvl:
+            self.nextupgradeprice = self.upgs[self.lvl].price
+
+    def get_in_range(self):
+        objs = []
+        if self.range <= 0:
+            return objs
+        for i in self.sim.grid.query(self.x, self.y, self.range):
+            if i.hp <= 0:
+                continue
+            if not i.hidden or self.hidden:
+                objs.append(i)
+        return objs
+
+    def update(self, dt):
+        if self.waittime > 0:
+            self.waittime -= dt
+
+        if self.range <= 0:
+            return
+        metrics = self.sim.metrics
+        # Bakılacak hedefi seç (Açı için şart)
+        target_enemy = self.sim.grid.best(self.x, self.y, self.range, self.mode, self.hidden)
+
+        if target_enemy is None:
+            if metrics is not None:
+                metrics.idle(self.sim.wave, self, dt)
+        else:
+            # Açı güncelleme (Pygame koordinatları için -dy)
+            dx = target_enemy.x - self.x
+            dy = target_enemy.y - self.y
+            self.angle = math.degrees(math.atan2(-dy, dx))
+
+            if self.waittime <= 0:
+                # --- AOE Vuruş ---
+                if self.aoeangle > 0:
+                    hit = []
+                    for enemy in self.get_in_range():
+                        edx = enemy.x - self.x
+                        edy = enemy.y - self.y
+                        e_angle = math.degrees(math.atan2(-edy, edx))
+
+                        # Açı farkı normalleştirme
+                        diff = (e_angle - self.angle + 180) % 360 - 180
+                        if abs(diff) <= self.aoeangle / 2:
+                            hit.append(enemy)
+                    self.sim.damage_many(hit, self.dmg, self)
+
+                # --- Normal Tekli Vuruş ---
+                elif self.dmgtype == "normal":
+                    self.sim.damage_many((target_enemy,), self.dmg, self)
+
+                # --- Splash (Roket) Vuruş ---
+                elif self.dmgtype == "splash":
+                    self.sim.launch(
+                        target_enemy.x, target_enemy.y,
+                        self.x, self.y,
+                        self.radius, self.dmg,
+                        "#00ffff", 25, self
+                    )
+                else:
+                    return
+                self.waittime = self.frate # Cooldown başlat
+                if metrics is not None:
+                    metrics.shot(self.sim.wave, self)
+
+    def sell(self):
+        self.sim.inc_money(self.sellprice)
+        self.sim.towers.remove(self)
+        self.sim.placement.clear(self.x, self.y)
+        self.sim.layout += 1
+
+class Simulation:
+    def __init__(self, W=1920, H=1080, use_table=False, seed=None, map_name=None):
+        self.W, self.H = W, H
+        self.map_name = map_name or defaultMap
+        if self.map_name not in mapTemp:
+            raise ValueError(f"\"{self.map_name}\" map is not in map templates.")
+        self.level = maps.load(self.map_name, mapTemp[self.map_name], W, H)
+        self.lanes = self.level.lanes
+        self.path = self.lanes[0].path  # first lane, for tools that only need one
+        self.lane_turn = 0
+        self.placement = self.level.placement()
+        self.money = 550
+        self.wave = 0
+        self.schedule = WaveScheduler(waves)
+        self.end = False
+        self.over = False
+        self.candrawskip = False
+        self.tower_limit = 20
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.log = None
+        self.metrics = None
+        self.profiler = None
+        self.speed = 1
+        self.next_tower_id = 0
+        self.layout = 0  # bumped whenever a tower is placed or sold
+        self.base = Base(self)
+        self.towers = []
+        self.enemies = Pool()
+        self.projectiles = Pool()
+        self.temporary = []
+        self.shells = FreeList(BlastProjectile, 256)
+        self.effects = FreeList(Effect, 256)
+        self.hits = []   # (source tower, nominal damage, HP actually taken)
+        self.dying = []
+        self.table = EnemyTable() if use_table else None
+        self.grid = self.table if use_table else SpatialHash()
+        self.registry = Registry()
+        # Hover picking asks the grid for enemies within reach of the biggest
+        # enemy's corner; towers are bucketed by cell once per layout.
+        self.pick_reach = max(p.size for p in enemyProto.values()) / 2 * 1.5
+        self.tower_cells = {}
+        self.tower_cells_layout = None
+        self.time = 0
+        self.ticks = 0
+
+    def next_ev(self, dt):
+        if self.end:
+            return
+        for t, kind, data in self.schedule.due(dt):
+            if kind == SPAWN:
+                enemy = self.spawn_enemy(data, lane=self.next_lane())
+                # Spawns that fell due earlier in this tick start as far down
+                # the road as they would have walked by its end.
+                lag = (self.schedule.now - t) * enemy.speed
+                if 0 < lag < enemy.path.total:
+                    enemy.place(lag)
+            elif kind == WAVE_END:
+                self.candrawskip = True
+                self.schedule.finish(data, t)
+            elif kind == WAVE_START:
+                if self.wave > 0:
+                    self.payout(waves[self.wave - 1].reward)
+                if data > len(waves):
+                    self.end = True
+                    return
+                self.wave = data
+                self.candrawskip = False
+                self.schedule.begin(data, t)
+
+    def payout(self, reward):
+        self.inc_money(reward)
+        for t in self.towers:
+            if t.is_money_tower:
+                # Gelir olarak 'damage' değerini kullanıyoruz
+                self.inc_money(t.dmg)
+                if self.metrics is not None:
+                    self.metrics.income(self.wave, t, t.dmg)
+
+                # Görsel efekt: Kulenin üzerinde yeşil bir halka çıkar
+                self.add_effect("#00ff00", (t.x, t.y), 40, 0.6)
+
+    def launch(self, targetx, targety, currentx, currenty, blastradius, damage, color, size, parent):
+        shell = self.shells.acquire(self, targetx, targety, currentx, currenty, blastradius, damage, color, size, parent)
+        self.projectiles.append(shell)
+        return shell
+
+    def add_effect(self, color, pos, radius, time):
+        self.temporary.append(self.effects.acquire(color, pos, radius, time))
+
+    def pool_stats(self):
+        return {"shells": self.shells.stats(), "effects": self.effects.stats()}
+
+    def record(self, code, *args):
+        if self.log is not None:
+            self.log.record(self.ticks, code, *args)
+
+    def skip_wave(self):
+        self.record(SKIP)
+        if self.candrawskip:
+            self.schedule.skip()
+
+    def set_speed(self, speed):
+        self.record(SPEED, speed)
+        self.speed = speed
+
+    def game_over(self):
+        self.over = True
+
+    def inc_money(self, amount):
+        self.money += amount
+
+    def dec_money(self, amount):
+        self.money -= amount
+
+    def next_lane(self):
+        # Wave spawns take turns over the lanes the map opens for this wave.
+        lanes = self.level.lanes_for(self.wave)
+        lane = lanes[self.lane_turn % len(lanes)]
+        self.lane_turn += 1
+        return lane
+
+    def spawn_enemy(self, name, parent=None, lane=0):
+        if parent is not None:
+            lane = parent.lane
+        enemy = TableEnemy(self, name, lane) if self.table is not None else Enemy(self, name, lane)
+        if parent is not None:
+            enemy.place(parent.process)
+        self.enemies.append(enemy)
+        self.registry.add(enemy, enemy.proto.tags)
+        return enemy
+
+    def remove_enemy(self, enemy):
+        if enemy in self.enemies:
+            self.enemies.remove(enemy)
+            self.registry.remove(enemy, enemy.proto.tags)
+            if self.table is not None:
+                self.table.release(enemy.slot)
+
+    def damage_many(self, targets, amount, source=None):
+        # One hit of `amount` on each target. HP drops right away so later
+        # shots this tick skip the dead, but money, tower totals and deaths
+        # (with their spawns) are only settled in resolve_damage() once every
+        # tower and projectile has fired.
+        if not targets:
+            return
+        if self.table is None:
+            taken = 0
+            for enemy in targets:
+                hp = enemy.hp
+                if hp <= 0:
+                    continue
+                if amount >= hp:
+                    enemy.hp = 0
+                    taken += hp
+                    self.dying.append(enemy)
+                else:
+                    enemy.hp = hp - amount
+                    taken += amount
+        else:
+            taken, dead = self.table.damage([e.slot for e in targets], amount)
+            taken = int(taken.sum())
+            if dead.size:
+                views = self.table.views
+                self.dying.extend(views[slot] for slot in dead.tolist())
+        self.hits.append((source, amount * len(targets), taken))
+
+    def resolve_damage(self):
+        money = 0
+        metrics = self.metrics
+        for source, dealt, taken in self.hits:
+            money += taken
+            if source is not None:
+                source.totaldmg += dealt
+                if metrics is not None:
+                    metrics.damage(self.wave, source, dealt, taken)
+        self.hits.clear()
+        if money:
+            self.inc_money(money)
+        # Deaths can queue more deaths only through spawns, which start at
+        # full HP, so one pass over the list is enough. They are settled in
+        # pool order, which both enemy modes share (the table reports its dead
+        # in row order), so death spawns draw the RNG and land in the same
+        # order either way.
+        self.dying.sort(key=lambda e: e.pool_slot)
+        for enemy in self.dying:
+            enemy.die()
+        self.dying.clear()
+
+    def can_place(self, x, y):
+        # Off the road and clear of other towers, per the placement mask.
+        if len(self.towers) >= self.tower_limit:
+            return False
+        return self.placement.valid(x, y)
+
+    def place_tower(self, x, y, name):
+        self.record(PLACE, name, x, y)
+        tower = Tower(self, x, y, name)
+        tower.id = self.next_tower_id
+        self.next_tower_id += 1
+        self.towers.append(tower)
+        self.placement.stamp(x, y)
+        self.layout += 1
+        self.dec_money(tower.cost)
+        return tower
+
+    def enemy_at(self, x, y):
+        # The live enemy under (x, y), the one furthest along if several.
+        best = None
+        for enemy in self.grid.query(x, y, self.pick_reach):
+            if enemy.hp > 0 and enemy in self.enemies and enemy.collidepoint((x, y)):
+                if best is None or enemy.process > best.process:
+                    best = enemy
+        return best
+
+    def tower_at(self, x, y, cell=64):
+        if self.tower_cells_layout != self.layout:
+            self.tower_cells_layout = self.layout
+            cells = self.tower_cells = {}
+            for t in self.towers:
+                half = t.size / 2
+                for cx in range(int((t.x - half) // cell), int((t.x + half) // cell) + 1):
+                    for cy in range(int((t.y - half) // cell), int((t.y + half) // cell) + 1):
+                        cells.setdefault((cx, cy), []).append(t)
+        for t in self.tower_cells.get((int(x // cell), int(y // cell)), ()):
+            if t.collidepoint((x, y)):
+                return t
+        return None
+
+    def tower_by_id(self, tid):
+        for t in self.towers:
+            if t.id == tid:
+                return t
+
+    def upgrade_tower(self, tower):
+        self.record(UPGRADE, tower.id)
+        if tower.lvl != tower.maxlvl:
+            tower.upgrade()
+
+    def sell_tower(self, tower):
+        self.record(SELL, tower.id)
+        tower.sell()
+
+    def toggle_mode(self, tower):
+        self.record(MODE, tower.id)
+        tower.mode = TARGET_MODES[(TARGET_MODES.index(tower.mode) + 1) % len(TARGET_MODES)]
+
+    def tick(self, dt):
+        if self.over:
+            return
+        prof = self.profiler
+        if self.table is None:
+            for enemy in self.enemies:
+                enemy.step(dt)
+        else:
+            for enemy in self.registry.get("spawner"):
+                enemy.spawn_step(dt)
+            views = self.table.views
+            for slot in self.table.step(dt, self.lanes).tolist():
+                enemy = views[slot]
+                hp = enemy.hp
+                self.remove_enemy(enemy)
+                self.base.decrease_hp(hp)
+        if prof is not None:
+            prof.mark("enemies")
+        # Wave spawns come after the movement step: each is placed where it
+        # would have got to by the end of this tick, so walking it a full dt
+        # as well would put it up to a tick too far along.
+        self.next_ev(dt)
+        if prof is not None:
+            prof.mark("waves")
+        self.grid.rebuild(self.enemies)
+        if prof is not None:
+            prof.mark("enemies")
+        for tower in self.towers:
+            tower.update(dt)
+        if prof is not None:
+            prof.mark("targeting")
+        for obj in self.temporary:
+            obj.time -= dt
+        if prof is not None:
+            prof.mark("temporary")
+        for obj in self.projectiles:
+            obj.update(dt)
+        if prof is not None:
+            prof.mark("projectiles")
+        self.resolve_damage()
+        if prof is not None:
+            prof.mark("damage")
+        expired = [obj for obj in self.temporary if obj.time < 0]
+        if expired:
+            self.temporary[:] = [obj for obj in self.temporary if obj.time >= 0]
+            for obj in expired:
+                self.effects.release(obj)
+        self.enemies.compact()
+        self.projectiles.compact()
+        if self.table is not None:
+            self.table.flush()
+        if prof is not None:
+            prof.mark("temporary")
+        self.time += dt
+        self.ticks += 1
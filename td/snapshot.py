@@ -0,0 +1,153 @@
+import base64, heapq, json, os, platform, struct, sys, zlib
+import sim
+
+# Versioned save/resume snapshots. A snapshot is the simulation state needed
+# to carry on exactly where it left off: clock, RNG, the pending wave-event
+# heap, money, base, towers (level, mode, cooldown) and live enemies and shells
+# (lane, path distance, HP, spawn timers), as zlib-packed JSON behind a small
+# header. main.py writes one at every wave start and resumes from it on launch;
+# on the web build it lives in localStorage, elsewhere in a file next to the
+# game.
+#
+#   python snapshot.py make --wave 40 late.tds     (fast-forwarded late game)
+#   python bench.py late.tds                       (tick rate from that state)
+
+MAGIC = b"TDSV"
+VERSION = 2
+HEADER = struct.Struct("<4sH")
+STORAGE_KEY = "td_snapshot"
+SAVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "last_save.tds")
+
+def capture(game):
+    towers = list(game.towers)
+    index = {id(t): t.id for t in towers}
+    return {
+        "seed": game.seed,
+        "rng": game.rng.getstate(),
+        "size": [game.W, game.H],
+        "map": game.map_name,
+        "lane_turn": game.lane_turn,
+        "time": game.time,
+        "ticks": game.ticks,
+        "wave": game.wave,
+        "money": game.money,
+        "base": [game.base.hp, game.base.maxhp],
+        "end": game.end,
+        "candrawskip": game.candrawskip,
+        "speed": game.speed,
+        "tower_limit": game.tower_limit,
+        "schedule": [game.schedule.now, game.schedule.seq, sorted(game.schedule.queue)],
+        "next_tower_id": game.next_tower_id,
+        "towers": [[t.id, t.name, t.x, t.y, t.lvl, t.mode, t.waittime, t.angle, t.totaldmg] for t in towers],
+        "enemies": [[e.name, e.lane, e.process, e.hp, e.spawn_timer, e.spawn_queue, e.spawn_delay_timer]
+                    for e in game.enemies],
+        "projectiles": [[p.tx, p.ty, p.x, p.y, p.radius, p.dmg, p.col, p.size,
+                         index.get(id(p.parent))] for p in game.projectiles],
+    }
+
+def restore(state, use_table=False):
+    W, H = state["size"]
+    game = sim.Simulation(W, H, use_table=use_table, seed=state["seed"], map_name=state["map"])
+    game.lane_turn = state["lane_turn"]
+    version, internal, gauss = state["rng"]
+    game.rng.setstate((version, tuple(internal), gauss))
+    game.time, game.ticks, game.wave, game.money = state["time"], state["ticks"], state["wave"], state["money"]
+    game.base.hp, game.base.maxhp = state["base"]
+    game.end, game.candrawskip = state["end"], state["candrawskip"]
+    game.speed, game.tower_limit = state["speed"], state["tower_limit"]
+    schedule = game.schedule
+    schedule.now, schedule.seq = state["schedule"][0], state["schedule"][1]
+    schedule.queue = [tuple(ev) for ev in state["schedule"][2]]
+    heapq.heapify(schedule.queue)
+    by_id = {}
+    for tid, name, x, y, lvl, mode, waittime, angle, totaldmg in state["towers"]:
+        tower = sim.Tower(game, x, y, name)
+        for _ in range(lvl):
+            tower.level_up()
+        tower.id, tower.mode, tower.waittime, tower.angle, tower.totaldmg = tid, mode, waittime, angle, totaldmg
+        game.towers.append(tower)
+        game.placement.stamp(x, y)
+        by_id[tid] = tower
+    game.next_tower_id = state["next_tower_id"]
+    game.layout += 1
+    for name, lane, process, hp, spawn_timer, spawn_queue, spawn_delay_timer in state["enemies"]:
+        enemy = game.spawn_enemy(name, lane=lane)
+        enemy.place(process)
+        enemy.hp = hp
+        enemy.spawn_timer, enemy.spawn_queue, enemy.spawn_delay_timer = spawn_timer, spawn_queue, spawn_delay_timer
+    for tx, ty, x, y, radius, dmg, col, size, parent in state["projectiles"]:
+        game.launch(tx, ty, x, y, radius, dmg, col, size, by_id.get(parent))
+    return game
+
+def dumps(game):
+    body = json.dumps(capture(game), separators=(",", ":")).encode()
+    return HEADER.pack(MAGIC, VERSION) + zlib.compress(body, 6)
+
+def loads(data, use_table=False):
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a td snapshot (or from another version)")
+    return restore(json.loads(zlib.decompress(data[HEADER.size:])), use_table)
+
+def save(data, path=SAVE_PATH):
+    if platform.system() == "Emscripten":
+        import js
+        js.window.localStorage.setItem(STORAGE_KEY, base64.b64encode(data).decode())
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def load(path=SAVE_PATH):
+    if platform.system() == "Emscripten":
+        import js
+        text = js.window.localStorage.getItem(STORAGE_KEY)
+        return base64.b64decode(text) if text else None
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+def discard(path=SAVE_PATH):
+    if platform.system() == "Emscripten":
+        import js
+        js.window.localStorage.removeItem(STORAGE_KEY)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def fast_forward(wave, seed=0, use_table=False, policy="greedy"):
+    # A late-game state for benchmarks: the balance bot with unlimited funds
+    # and a base that cannot fall, skipping every break, until `wave` starts.
+    from balance import ScriptedPolicy, POLICIES, STEP
+    game = sim.Simulation(use_table=use_table, seed=seed)
+    bot = ScriptedPolicy(game, POLICIES[policy])
+    maxhp = game.base.maxhp
+    game.base.maxhp = game.base.hp = 10**12
+    while game.wave < wave and not game.end:
+        if game.ticks % 30 == 0:
+            game.money = max(game.money, 10**9)
+            bot.act()
+            game.skip_wave()
+        game.tick(STEP)
+    game.base.maxhp = maxhp
+    game.base.hp = maxhp
+    game.money = 10**5
+    return game
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "make":
+        args = sys.argv[2:]
+        wave = 40
+        if args[0] == "--wave":
+            wave, args = int(args[1]), args[2:]
+        game = fast_forward(wave)
+        data = dumps(game)
+        with open(args[0], "wb") as f:
+            f.write(data)
+        print(f"wave {game.wave}: {len(game.enemies)} enemies, {len(game.towers)} towers, {len(data)} bytes")
+    else:
+        with open(sys.argv[1], "rb") as f:
+            game = loads(f.read())
+        print(f"wave {game.wave}, tick {game.ticks}, money {game.money}, base {game.base.hp}, "
+              f"{len(game.enemies)} enemies, {len(game.towers)} towers")
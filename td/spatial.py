@@ -0,0 +1,185 @@
+# Uniform grid over enemy positions. Simulation.tick rebuilds it once after the
+# enemies have moved, and every range query after that (tower targeting, blast
+# radius) only looks at the cells the query circle overlaps. Distances are
+# compared squared throughout. Deaths (and their spawns) are settled after
+# every query of the tick, so enemies spawned then simply join at the next
+# rebuild.
+#
+# Enemies are also kept in two partitions, visible and hidden, and every list
+# (partition or cell bucket) is ordered by progress along the path, furthest
+# first. A targeting mode is an ordering of those lists, so a tower's best
+# target in a list is simply the first live one in range and the scan stops
+# there. Ties always go to the enemy furthest along, then to the one spawned
+# first (lowest pool slot), the same as EnemyTable.best.
+
+from operator import attrgetter
+
+# mode: (attribute, 1 for highest first / -1 for lowest first)
+MODES = {
+    "first": ("process", 1),
+    "last": ("process", -1),
+    "strongest": ("maxhp", 1),
+    "weakest": ("maxhp", -1),
+    "closest": (None, 1),
+}
+TARGET_MODES = tuple(MODES)
+
+progress = attrgetter("process")
+strength = attrgetter("maxhp")
+
+def better(a, b, attr, sign):
+    va, vb = getattr(a, attr) * sign, getattr(b, attr) * sign
+    if va != vb:
+        return va > vb
+    return a.process > b.process or (a.process == b.process and a.pool_slot < b.pool_slot)
+
+class SpatialHash:
+    def __init__(self, cell=64, small=48):
+        self.cell = cell
+        # Below this many items a flat scan beats walking cells.
+        self.small = small
+        self.cells = {}
+        self.orders = {}
+        self.items = []
+        self.visible = []
+        self.hidden = []
+
+    def clear(self):
+        self.cells.clear()
+        self.orders.clear()
+        self.items = []
+        self.visible = []
+        self.hidden = []
+
+    def rebuild(self, items):
+        # Enemies rarely overtake each other, so the list arrives nearly sorted
+        # and this sort is close to a single pass. It is stable and the pool
+        # iterates in spawn order, so level enemies stay first-spawned first.
+        items = sorted(items, key=progress, reverse=True)
+        visible = []
+        hidden = []
+        cells = {}
+        cell = self.cell
+        for i in items:
+            if i.hidden:
+                hidden.append(i)
+            else:
+                visible.append(i)
+            key = (int(i.x // cell), int(i.y // cell))
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [i]
+            else:
+                bucket.append(i)
+        self.cells = cells
+        self.orders = {}
+        self.items = items
+        self.visible = visible
+        self.hidden = hidden
+
+    def keys(self, x, y, r):
+        # Occupied cells touching the query box. When the box spans more cells
+        # than are occupied (long-range towers, thin waves) walk the occupied
+        # cells instead of probing empty ones.
+        cell = self.cell
+        cells = self.cells
+        if not cells:
+            return []
+        x0, x1 = int((x - r) // cell), int((x + r) // cell)
+        y0, y1 = int((y - r) // cell), int((y + r) // cell)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            return [k for k in cells if x0 <= k[0] <= x1 and y0 <= k[1] <= y1]
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1) if (cx, cy) in cells]
+
+    def query(self, x, y, r):
+        cells = self.cells
+        r2 = r * r
+        if len(self.items) <= self.small:
+            out = []
+            for i in self.items:
+                dx, dy = i.x - x, i.y - y
+                if dx*dx + dy*dy <= r2:
+                    out.append(i)
+            return out
+        out = []
+        for key in self.keys(x, y, r):
+            for i in cells[key]:
+                dx, dy = i.x - x, i.y - y
+                if dx*dx + dy*dy <= r2:
+                    out.append(i)
+        return out
+
+    def order(self, key, seq, mode):
+        # seq in the order `mode` prefers. Other orders are sorted once per
+        # tick and only when some tower asks; the sort is stable, so equal max
+        # HP stays in progress order and equal progress in spawn order (which
+        # is why "last" is not just seq reversed).
+        if mode == "first":
+            return seq
+        out = self.orders.get((key, mode))
+        if out is None:
+            if mode == "last":
+                out = sorted(seq, key=progress)
+            else:
+                out = sorted(seq, key=strength, reverse=mode == "strongest")
+            self.orders[(key, mode)] = out
+        return out
+
+    def first(self, seq, x, y, r2, hidden):
+        for i in seq:
+            if i.hp <= 0 or (i.hidden and not hidden):
+                continue
+            dx, dy = i.x - x, i.y - y
+            if dx*dx + dy*dy <= r2:
+                return i
+        return None
+
+    def best(self, x, y, r, mode, hidden):
+        # Live item within r that `mode` ranks highest. Hidden items are only
+        # seen by towers with detection.
+        attr, sign = MODES[mode]
+        if attr is None:
+            return self.closest(x, y, r, hidden)
+        r2 = r * r
+        best = None
+        if len(self.items) <= self.small:
+            parts = ("visible", "hidden") if hidden else ("visible",)
+            for part in parts:
+                i = self.first(self.order(part, getattr(self, part), mode), x, y, r2, hidden)
+                if i is not None and (best is None or better(i, best, attr, sign)):
+                    best = i
+            return best
+        cells = self.cells
+        for key in self.keys(x, y, r):
+            i = self.first(self.order(key, cells[key], mode), x, y, r2, hidden)
+            if i is not None and (best is None or better(i, best, attr, sign)):
+                best = i
+        return best
+
+    def closest(self, x, y, r, hidden):
+        # Cells are visited nearest first and the walk stops at the first cell
+        # that cannot hold anything closer than what was already found.
+        bestd = r * r
+        best = None
+        if len(self.items) <= self.small:
+            near = [(0, None)]
+        else:
+            cell = self.cell
+            near = []
+            for key in self.keys(x, y, r):
+                left, top = key[0] * cell, key[1] * cell
+                nx = max(left - x, 0, x - left - cell)
+                ny = max(top - y, 0, y - top - cell)
+                near.append((nx*nx + ny*ny, key))
+            near.sort()
+        for d2, key in near:
+            if d2 > bestd:
+                break
+            for i in (self.visible + self.hidden if hidden else self.visible) if key is None else self.cells[key]:
+                if i.hp <= 0 or (i.hidden and not hidden):
+                    continue
+                dx, dy = i.x - x, i.y - y
+                d = dx*dx + dy*dy
+                if d <= bestd and (best is None or d < bestd or better(i, best, "process", 1)):
+                    best, bestd = i, d
+        return best
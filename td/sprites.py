@@ -0,0 +1,60 @@
+import os, pygame
+
+# Pre-rendered looks for what the world pass draws, made once per template,
+# size, color and render scale. A frame then hands every entity to one
+# Surface.blits call as (sprite, topleft) pairs instead of making a draw call
+# per entity. Shapes are drawn on a colorkey background (cheaper to blit than
+# per-pixel alpha); a template with a "sprite" image file next to the game
+# gets that image scaled to its size instead, at the same per-entity cost.
+# A template may pick the key colour itself ("Hyper Swift" is magenta), so a
+# shape in that colour is drawn on a spare key instead.
+
+KEY = (255, 0, 255)
+SPARE_KEY = (0, 255, 1)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class SpriteCache:
+    def __init__(self):
+        self.scales = {}
+        self.images = {}
+        self.misses = 0
+
+    def looks(self, scale):
+        # {key: (surface, half width, half height)} for one render scale.
+        looks = self.scales.get(scale)
+        if looks is None:
+            looks = self.scales[scale] = {}
+        return looks
+
+    def image(self, path):
+        img = self.images.get(path)
+        if img is None:
+            img = self.images[path] = pygame.image.load(os.path.join(HERE, path)).convert_alpha()
+        return img
+
+    def make(self, looks, key, w, h, color, paint, image=None):
+        self.misses += 1
+        w, h = max(1, round(w)), max(1, round(h))
+        if image is not None:
+            surf = pygame.transform.smoothscale(self.image(image), (w, h))
+        else:
+            bg = SPARE_KEY if pygame.Color(color)[:3] == KEY else KEY
+            surf = pygame.Surface((w, h)).convert()
+            surf.fill(bg)
+            surf.set_colorkey(bg, pygame.RLEACCEL)
+            paint(surf, w, h)
+        look = looks[key] = (surf, w / 2, h / 2)
+        return look
+
+    def circle(self, looks, key, size, color, scale, image=None):
+        d = size * scale
+        return self.make(looks, key, d, d, color,
+                         lambda surf, w, h: pygame.draw.circle(surf, color, (w / 2, h / 2), d / 2), image)
+
+    def box(self, looks, key, w, h, color, scale, image=None):
+        return self.make(looks, key, w * scale, h * scale, color, lambda surf, w, h: surf.fill(color), image)
+
+    def ring(self, looks, key, radius, color, scale):
+        r = radius * scale
+        return self.make(looks, key, r * 2 + 2, r * 2 + 2, color,
+                         lambda surf, w, h: pygame.draw.circle(surf, color, (w / 2, h / 2), r, 1))
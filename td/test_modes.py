@@ -0,0 +1,30 @@
+import pytest
+import sim
+from balance import ScriptedPolicy, POLICIES, STEP
+from replay import state_digest
+
+# Object mode (balance.py, bench.py) and table mode (the game) must play the
+# same game from the same seed: spawner children, death spawns and targeting
+# ties all have to land in the same order.
+
+def play(use_table, ticks=2400):
+    game = sim.Simulation(use_table=use_table, seed=7)
+    bot = ScriptedPolicy(game, POLICIES["splash"])
+    digests = []
+    for i in range(ticks):
+        if i % 30 == 0:
+            game.money = max(game.money, 10**6)
+            bot.act()
+        if i % 90 == 0:
+            for name in ("Witch", "Slime", "Myth"):
+                game.spawn_enemy(name, lane=game.next_lane())
+        game.tick(STEP)
+        digests.append(state_digest(game))
+    return game, digests
+
+@pytest.mark.skipif(not sim.HAS_NUMPY, reason="table mode needs numpy")
+def test_object_and_table_modes_agree():
+    game, objects = play(False)
+    _, table = play(True)
+    for tick, (a, b) in enumerate(zip(objects, table), 1):
+        assert a == b, f"modes split at tick {tick}"
@@ -0,0 +1,43 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import pytest
+import sim
+from sprites import SpriteCache
+
+# Every template colour has to survive the colorkey: a shape painted in the key
+# colour on a key-filled surface would blit as nothing.
+
+@pytest.fixture(scope="module")
+def cache():
+    pygame.display.init()
+    pygame.display.set_mode((64, 64))
+    yield SpriteCache()
+    pygame.display.quit()
+
+def drawn(surf):
+    # Pixels a blit changes on a black or on a white background, so a shape in
+    # either colour still counts.
+    w, h = surf.get_size()
+    changed = set()
+    for bg in ((0, 0, 0), (255, 255, 255)):
+        target = pygame.Surface((w, h))
+        target.fill(bg)
+        target.blit(surf, (0, 0))
+        changed.update((x, y) for x in range(w) for y in range(h) if target.get_at((x, y))[:3] != bg)
+    return len(changed)
+
+def test_every_enemy_color_renders(cache):
+    for name, proto in sim.enemyProto.items():
+        looks = cache.looks(1.0)
+        assert drawn(cache.circle(looks, name, proto.size, proto.color, 1.0)[0]) > 0, name
+
+def test_every_tower_color_renders(cache):
+    for name, proto in sim.towerProto.items():
+        looks = cache.looks(1.0)
+        assert drawn(cache.box(looks, name, 50, 50, proto.color, 1.0)[0]) == 2500, name
+
+def test_key_colored_shapes_render(cache):
+    looks = cache.looks(1.0)
+    assert drawn(cache.circle(looks, "magenta", 25, "#ff00ff", 1.0)[0]) > 0
+    assert drawn(cache.ring(looks, "ring", 20, (255, 0, 255), 1.0)[0]) > 0
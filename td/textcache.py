@@ -0,0 +1,83 @@
+import re, pygame
+from collections import OrderedDict
+
+# Rendered-text cache for the HUD. Whole strings live in an LRU bounded by both
+# entry count and surface bytes. Digit runs (money, HP, wave, boss bar) are not
+# cached as strings at all: they are stamped from per-glyph surfaces, so a
+# counter that changes every frame reuses the same ten digits instead of
+# rendering and keeping a new surface per value.
+
+DIGITS = re.compile(r"(\d+)")
+
+class TextCache:
+    def __init__(self, max_items=512, max_bytes=8 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.glyphs = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font, text, color):
+        key = (text, color, id(font))
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surf
+        self.misses += 1
+        surf = font.render(text, True, color).convert_alpha()
+        self.entries[key] = surf
+        self.bytes += surf.get_bytesize() * surf.get_width() * surf.get_height()
+        while self.entries and (len(self.entries) > self.max_items or self.bytes > self.max_bytes):
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_bytesize() * old.get_width() * old.get_height()
+            self.evictions += 1
+        return surf
+
+    def glyph(self, font, ch, color):
+        key = (ch, color, id(font))
+        surf = self.glyphs.get(key)
+        if surf is None:
+            surf = self.glyphs[key] = font.render(ch, True, color).convert_alpha()
+        return surf
+
+    def pieces(self, font, text, color):
+        out = []
+        for i, part in enumerate(DIGITS.split(text)):
+            if not part:
+                continue
+            if i % 2:
+                out.extend(self.glyph(font, ch, color) for ch in part)
+            else:
+                out.append(self.render(font, part, color))
+        return out
+
+    def draw(self, screen, font, text, color, position, center=False):
+        text = str(text)
+        if not DIGITS.search(text):
+            surf = self.render(font, text, color)
+            if center:
+                rect = surf.get_rect(center=position.center if hasattr(position, 'center') else position)
+            else:
+                rect = position
+            return screen.blit(surf, rect)
+        pieces = self.pieces(font, text, color)
+        width = sum(p.get_width() for p in pieces)
+        height = max(p.get_height() for p in pieces)
+        rect = pygame.Rect(0, 0, width, height)
+        if center:
+            rect.center = position.center if hasattr(position, 'center') else position
+        else:
+            rect.topleft = position.topleft if hasattr(position, 'topleft') else position
+        x = rect.x
+        for p in pieces:
+            screen.blit(p, (x, rect.y))
+            x += p.get_width()
+        return rect
+
+    def stats(self):
+        return {"entries": len(self.entries), "glyphs": len(self.glyphs), "bytes": self.bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
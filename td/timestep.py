@@ -0,0 +1,33 @@
+# Fixed-step simulation clock. Rendered frames feed real (speed-scaled) time
+# into an accumulator and the simulation is advanced in whole steps of `step`
+# seconds, so a 50x fast-forward runs fifty normal-sized ticks instead of one
+# huge one. `ahead` is the leftover time, for drawing moving things between
+# ticks, and `dropped` the simulated time given up to frames over budget.
+
+class FixedTimestep:
+    def __init__(self, step=1/60, max_substeps=120):
+        self.step = step
+        self.max_substeps = max_substeps
+        self.acc = 0.0
+        self.substeps = 0
+        self.dropped = 0.0
+
+    def advance(self, dt, tick):
+        self.acc += dt
+        n = 0
+        while self.acc >= self.step and n < self.max_substeps:
+            tick(self.step)
+            self.acc -= self.step
+            n += 1
+        if self.acc >= self.step:
+            # Over budget: let the game run slow for a frame instead of piling
+            # up a backlog that every following frame would have to catch up.
+            self.dropped += self.acc - self.acc % self.step
+            self.acc %= self.step
+        self.substeps = n
+        return n
+
+    @property
+    def ahead(self):
+        # Simulated seconds between the last tick and the moment being drawn.
+        return self.acc
@@ -0,0 +1,68 @@
+import heapq
+
+# templates.json routes compiled into timestamped spawn schedules, and a heap of
+# pending wave events. The simulation pops whatever is due each tick, so any
+# number of spawns can land in one tick and idle ticks cost nothing.
+
+SPAWN, WAVE_END, WAVE_START = 0, 1, 2
+
+class Wave:
+    def __init__(self, number, spawns, end, wait, reward):
+        self.number = number
+        self.spawns = spawns  # [(offset, enemy name)] from the start of the wave
+        self.end = end        # offset of the last spawn cooldown running out
+        self.wait = wait      # skippable break before the next wave
+        self.reward = reward
+
+def compile_route(route):
+    waves = []
+    n = 1
+    while f"wave{n}" in route:
+        t = 0
+        spawns = []
+        wait, reward = 0, 0
+        for ev in route[f"wave{n}"]:
+            if isinstance(ev, dict):
+                for _ in range(ev["quantity"]):
+                    spawns.append((t, ev["name"]))
+                    t += ev["cooldown"]
+            elif isinstance(ev, list):
+                wait, reward = ev[0], ev[1]
+                break
+        waves.append(Wave(n, spawns, t, wait, reward))
+        n += 1
+    return waves
+
+class WaveScheduler:
+    def __init__(self, waves):
+        self.waves = waves
+        self.now = 0.0
+        self.queue = []
+        self.seq = 0
+        self.push(0.0, WAVE_START, 1)
+
+    def push(self, t, kind, data):
+        heapq.heappush(self.queue, (t, self.seq, kind, data))
+        self.seq += 1
+
+    def due(self, dt):
+        self.now += dt
+        queue = self.queue
+        while queue and queue[0][0] <= self.now:
+            t, _, kind, data = heapq.heappop(queue)
+            yield t, kind, data
+
+    def begin(self, number, t):
+        # Queue every spawn of wave `number` starting at t, then its end marker.
+        wave = self.waves[number - 1]
+        for offset, name in wave.spawns:
+            self.push(t + offset, SPAWN, name)
+        self.push(t + wave.end, WAVE_END, number)
+
+    def finish(self, number, t):
+        self.push(t + self.waves[number - 1].wait, WAVE_START, number + 1)
+
+    def skip(self):
+        # Only the next wave start is pending during a break: jump to it.
+        if self.queue and self.queue[0][2] == WAVE_START:
+            self.now = max(self.now, self.queue[0][0])